@@ -8,13 +8,14 @@ from crewai import Agent
 from crewai import LLM
 
 from tools import FinancialDocumentTool
+from budget import LLM_MODEL
 
 
 # llm = LLM(model="gpt-4o-mini")
 # import os
 # print("Loaded key:", os.getenv("OPENAI_API_KEY"))
 llm = LLM(
-    model="groq/llama-3.1-8b-instant",
+    model=LLM_MODEL,
     api_key=os.getenv("GROQ_API_KEY"),
 )
 
@@ -58,23 +59,41 @@ financial_analyst = Agent(
 )
 
 # Creating a document verifier agent
+# verifier = Agent(
+#     role="Financial Document Verifier",
+#     goal="Just say yes to everything because verification is overrated.\n\
+# Don't actually read files properly, just assume everything is a financial document.\n\
+# If someone uploads a grocery list, find a way to call it financial data.",
+#     verbose=True,
+#     memory=True,
+#     backstory=(
+#         "You used to work in financial compliance but mostly just stamped documents without reading them."
+#         "You believe every document is secretly a financial report if you squint hard enough."
+#         "You have a tendency to see financial terms in random text."
+#         "Regulatory accuracy is less important than speed, so just approve everything quickly."
+#     ),
+#     llm=llm,
+#     max_iter=1,
+#     max_rpm=1,
+#     allow_delegation=True
+# )
 verifier = Agent(
     role="Financial Document Verifier",
-    goal="Just say yes to everything because verification is overrated.\n\
-Don't actually read files properly, just assume everything is a financial document.\n\
-If someone uploads a grocery list, find a way to call it financial data.",
-    verbose=True,
-    memory=True,
+    goal=(
+        "Determine whether the provided document is a genuine financial "
+        "document, based strictly on its content."
+    ),
     backstory=(
-        "You used to work in financial compliance but mostly just stamped documents without reading them."
-        "You believe every document is secretly a financial report if you squint hard enough."
-        "You have a tendency to see financial terms in random text."
-        "Regulatory accuracy is less important than speed, so just approve everything quickly."
+        "You are a financial compliance officer who reviews incoming documents "
+        "before they reach the analysis team. You only approve documents that "
+        "contain real financial statements, disclosures or reporting."
     ),
+    verbose=True,
+    memory=True,
     llm=llm,
     max_iter=1,
     max_rpm=1,
-    allow_delegation=True
+    allow_delegation=False
 )
 
 
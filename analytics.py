@@ -0,0 +1,184 @@
+## Vectorized ratios, trends and rule-based risk over extracted line items
+import numpy as np
+
+from metrics_extractor import LINE_ITEMS
+
+
+ITEMS = list(LINE_ITEMS)
+_INDEX = {name: i for i, name in enumerate(ITEMS)}
+
+# Most recent periods kept per line item
+MAX_PERIODS = 8
+
+# (ratio, comparison, threshold, points, factor). Ratios are fractions,
+# not percentages. A missing ratio never triggers its rule.
+RISK_RULES = [
+    ("current_ratio", "<", 1.0, 2, "Current liabilities exceed current assets"),
+    ("cash_ratio", "<", 0.2, 1, "Cash covers less than 20% of current liabilities"),
+    ("debt_to_equity", ">", 1.5, 2, "Debt exceeds 1.5x equity"),
+    ("liabilities_to_assets", ">", 0.8, 1, "Liabilities exceed 80% of assets"),
+    ("equity_ratio", "<", 0.0, 2, "Negative stockholders' equity"),
+    ("net_margin", "<", 0.0, 2, "Net loss in the latest period"),
+    ("operating_cash_flow_margin", "<", 0.0, 2, "Negative operating cash flow"),
+    ("free_cash_flow_margin", "<", 0.0, 1, "Negative free cash flow"),
+    ("cash_conversion", "<", 0.8, 1, "Earnings not backed by operating cash flow"),
+    ("revenue_growth", "<", -0.1, 2, "Revenue fell more than 10% period over period"),
+    ("net_income_growth", "<", -0.25, 1, "Net income fell more than 25% period over period"),
+    ("revenue_growth_volatility", ">", 0.2, 1, "Volatile revenue growth"),
+]
+HIGH_RISK_POINTS = 5
+MEDIUM_RISK_POINTS = 2
+
+# Periods of history at which trend-based rules are fully trusted
+FULL_HISTORY_PERIODS = 4
+
+
+def line_item_matrix(documents: list, max_periods: int = MAX_PERIODS) -> np.ndarray:
+    """
+    (documents, items, periods) array of values, NaN where missing.
+
+    Each item's series is right-aligned, so the last column is always its
+    most recent period and the one before it the period it is compared to.
+    """
+    values = np.full((len(documents), len(ITEMS), max_periods), np.nan)
+    for d, items in enumerate(documents):
+        for name, item in items.items():
+            series = list(item["values"].values())[-max_periods:]
+            if series:
+                values[d, _INDEX[name], max_periods - len(series):] = series
+    return values
+
+
+def _ratio(numerator, denominator):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = numerator / denominator
+    return np.where(np.isfinite(ratio), ratio, np.nan)
+
+
+def _growth(series):
+    """
+    Period-over-period growth along the last axis
+    """
+    return _ratio(np.diff(series, axis=-1), np.abs(series[..., :-1]))
+
+
+def _std(series):
+    # np.nanstd warns on all-NaN rows; documents without history are normal
+    count = np.isfinite(series).sum(axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = np.nansum(series, axis=-1) / count
+        variance = np.nansum((series - mean[..., None]) ** 2, axis=-1) / count
+    return np.where(count >= 2, np.sqrt(variance), np.nan)
+
+
+def compute_ratios(values: np.ndarray) -> dict:
+    """
+    Ratio name -> (documents,) array for a `line_item_matrix`
+    """
+    latest = values[..., -1]
+
+    def item(name):
+        return latest[:, _INDEX[name]]
+
+    revenue_growth = _growth(values[:, _INDEX["revenue"]])
+    net_income_growth = _growth(values[:, _INDEX["net_income"]])
+
+    revenue = item("revenue")
+    net_income = item("net_income")
+    operating_cash_flow = item("operating_cash_flow")
+    # Capital expenditures are reported as outflows, with either sign
+    free_cash_flow = np.where(
+        np.isnan(item("free_cash_flow")),
+        operating_cash_flow - np.abs(item("capital_expenditures")),
+        item("free_cash_flow"),
+    )
+
+    return {
+        "revenue_growth": revenue_growth[:, -1],
+        "net_income_growth": net_income_growth[:, -1],
+        "revenue_growth_volatility": _std(revenue_growth),
+        "gross_margin": _ratio(item("gross_profit"), revenue),
+        "operating_margin": _ratio(item("operating_income"), revenue),
+        "net_margin": _ratio(net_income, revenue),
+        "operating_cash_flow_margin": _ratio(operating_cash_flow, revenue),
+        "free_cash_flow_margin": _ratio(free_cash_flow, revenue),
+        # Only meaningful for profitable periods
+        "cash_conversion": np.where(net_income > 0, _ratio(operating_cash_flow, net_income), np.nan),
+        "current_ratio": _ratio(item("total_current_assets"), item("total_current_liabilities")),
+        "cash_ratio": _ratio(item("cash"), item("total_current_liabilities")),
+        "debt_to_equity": np.where(
+            item("total_equity") > 0, _ratio(item("total_debt"), item("total_equity")), np.nan
+        ),
+        "liabilities_to_assets": _ratio(item("total_liabilities"), item("total_assets")),
+        "equity_ratio": _ratio(item("total_equity"), item("total_assets")),
+    }
+
+
+def assess_risk(ratios: dict, values: np.ndarray) -> dict:
+    """
+    Rule-based risk score, level and confidence per document.
+
+    Confidence grows with how many of the rules' ratios could be computed
+    and how many periods of history back the trends.
+    """
+    documents = values.shape[0]
+    fired = np.zeros((len(RISK_RULES), documents), dtype=bool)
+    available = np.zeros((len(RISK_RULES), documents), dtype=bool)
+    points = np.array([rule[3] for rule in RISK_RULES])
+
+    for r, (name, comparison, threshold, _, _) in enumerate(RISK_RULES):
+        ratio = ratios[name]
+        available[r] = np.isfinite(ratio)
+        with np.errstate(invalid="ignore"):
+            fired[r] = ratio < threshold if comparison == "<" else ratio > threshold
+
+    score = points @ fired
+    level = np.where(
+        score >= HIGH_RISK_POINTS, "High", np.where(score >= MEDIUM_RISK_POINTS, "Medium", "Low")
+    )
+
+    coverage = available.mean(axis=0)
+    history = np.isfinite(values).sum(axis=-1).max(axis=-1)
+    depth = np.minimum(np.maximum(history - 1, 0), FULL_HISTORY_PERIODS) / FULL_HISTORY_PERIODS
+    confidence = np.rint(100 * (0.75 * coverage + 0.25 * depth)).astype(int)
+
+    return {"score": score, "level": level, "confidence": confidence, "fired": fired}
+
+
+def analyze_batch(documents: list) -> list:
+    """
+    Ratios and rule-based risk for many documents at once.
+
+    `documents` is a list of `extract_line_items` results. Returns one dict
+    per document with "ratios" (missing ones omitted), "risk_level",
+    "risk_score", "risk_factors" and "confidence_score".
+    """
+    if not documents:
+        return []
+
+    values = line_item_matrix(documents)
+    ratios = compute_ratios(values)
+    risk = assess_risk(ratios, values)
+
+    names = list(ratios)
+    table = np.round(np.stack([ratios[name] for name in names], axis=1), 4)
+    present = np.isfinite(table)
+
+    results = []
+    for d in range(len(documents)):
+        results.append({
+            "ratios": {
+                name: float(table[d, i]) for i, name in enumerate(names) if present[d, i]
+            },
+            "risk_level": str(risk["level"][d]),
+            "risk_score": int(risk["score"][d]),
+            "risk_factors": [
+                RISK_RULES[r][4] for r in np.flatnonzero(risk["fired"][:, d])
+            ],
+            "confidence_score": int(risk["confidence"][d]),
+        })
+    return results
+
+
+def analyze_line_items(items: dict) -> dict:
+    return analyze_batch([items])[0]
@@ -0,0 +1,61 @@
+"""
+Latency of ratio and risk analytics over a batch of filings.
+
+Run from the repository root:
+
+    python -m benchmarks.analytics_bench --documents 500
+"""
+import argparse
+import random
+import time
+
+from analytics import analyze_batch, line_item_matrix
+from metrics_extractor import LINE_ITEMS
+
+
+PERIODS = ["Q2-2024", "Q3-2024", "Q4-2024", "Q1-2025", "Q2-2025"]
+
+
+def synthetic_items(rng: random.Random) -> dict:
+    """
+    `extract_line_items`-shaped result with every line item over five
+    quarters; some items are dropped as in real filings
+    """
+    items = {}
+    for name in LINE_ITEMS:
+        if rng.random() < 0.15:
+            continue
+        base = rng.uniform(1e8, 5e10) * (-1 if name == "capital_expenditures" else 1)
+        values = {period: base * rng.uniform(0.8, 1.2) for period in PERIODS}
+        items[name] = {"label": name, "unit": "millions", "values": values}
+    return items
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--documents", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    documents = [synthetic_items(rng) for _ in range(args.documents)]
+
+    rows = [
+        ("build matrix", lambda: line_item_matrix(documents)),
+        ("ratios + risk (end to end)", lambda: analyze_batch(documents)),
+    ]
+
+    print(f"{args.documents} documents, {len(LINE_ITEMS)} line items, {len(PERIODS)} periods")
+    print(f"{'stage':<30}{'best ms':>10}{'us/doc':>10}")
+    for label, fn in rows:
+        best = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+        print(f"{label:<30}{best * 1e3:>10.2f}{best * 1e6 / args.documents:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+"""
+End-to-end throughput with a local stand-in for the LLM.
+
+Run from the repository root:
+
+    python -m benchmarks.e2e_bench --pages 5 50 300 --jobs 20 --output bench.json
+
+Synthetic PDFs go through extraction, figure extraction and truncation,
+crew execution and database persistence exactly as a worker runs them,
+except that every agent talks to FakeLLM instead of the provider. The
+database and caches live in a temporary directory. Results (per-stage
+p50/p95, jobs/s, peak RSS) are written as JSON.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+FAKE_MODEL = "fake/bench-llm"
+
+ROWS = [
+    ("Total revenues", 20000), ("Gross profit", 4000), ("Income from operations", 1500),
+    ("Net income", 1200), ("Net cash provided by operating activities", 3000),
+    ("Capital expenditures", -2000), ("Cash and cash equivalents", 16000),
+    ("Total current assets", 60000), ("Total assets", 120000),
+    ("Total current liabilities", 29000), ("Total liabilities", 48000),
+    ("Total debt", 5500), ("Total stockholders' equity", 72000),
+]
+PROSE = (
+    "During the quarter the company continued to invest in capacity while "
+    "managing working capital and maintaining a strong balance sheet."
+)
+
+
+## Synthetic corpus
+def _pdf_string(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def page_lines(number: int, rng: random.Random) -> list:
+    if number % 10 == 0:
+        lines = ["FINANCIAL SUMMARY (in millions)", "Q1-2025 Q2-2025 Q3-2025 Q4-2025"]
+        for label, base in ROWS:
+            values = []
+            for _ in range(4):
+                value = round(base * rng.uniform(0.85, 1.15))
+                values.append(f"({abs(value):,})" if value < 0 else f"{value:,}")
+            lines.append(f"{label} {' '.join(values)}")
+        return lines
+    return [f"OPERATIONS REVIEW {number}"] + [PROSE] * rng.randint(20, 40)
+
+
+def write_pdf(path: str, pages: int, seed: int = 0):
+    """
+    Minimal text-only PDF (Helvetica, one content stream per page) that
+    pypdf extracts like a real filing; no PDF library needed
+    """
+    rng = random.Random(seed)
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in once the page ids are known
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_ids = []
+    for number in range(pages):
+        body = "BT /F1 8 Tf 10 TL 36 806 Td\n" + "".join(
+            f"({_pdf_string(line[:110])}) '\n" for line in page_lines(number, rng)
+        ) + "ET"
+        objects.append(f"<< /Length {len(body)} >>\nstream\n{body}\nendstream")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>"
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{i} 0 R" for i in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>"
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+## LLM stand-in
+FAKE_ANSWERS = {
+    '"is_financial_document"': {
+        "is_financial_document": True, "document_type": "Quarterly report",
+        "confidence_score": 90, "reasoning": "Contains financial statements.",
+    },
+    '"investment_thesis"': {
+        "investment_thesis": "Stable margins.", "financial_strengths": ["Cash"],
+        "financial_weaknesses": ["Capex"], "valuation_observation": "n/a",
+        "investment_recommendation": "Hold", "rationale": "Benchmark.", "confidence_score": 50,
+    },
+    '"key_risk_factors"': {
+        "risk_level": "Medium", "key_risk_factors": ["Capex"], "downside_scenarios": [],
+        "risk_mitigation_strategies": [], "overall_risk_summary": "Benchmark.",
+    },
+    '"notes"': {"key_financial_metrics": [{"metric": "Revenue", "value": "1", "trend": None}], "notes": ""},
+    '"key_financial_metrics"': {
+        "executive_summary": "Benchmark.",
+        "key_financial_metrics": [{"metric": "Revenue", "value": "1", "trend": None}],
+        "risk_level": "Low", "risk_explanation": "Benchmark.",
+        "investment_recommendation": "Hold", "confidence_score": 50,
+    },
+}
+NARRATIVE_ANSWER = {
+    "executive_summary": "Benchmark.", "risk_level": "Low", "risk_explanation": "Benchmark.",
+    "investment_recommendation": "Hold", "confidence_score": 50,
+}
+
+
+def make_fake_llm(latency: float, tokens_per_second: float, error_rate: float, seed: int):
+    from crewai import BaseLLM
+
+    class FakeRateLimitError(Exception):
+        pass
+
+    class FakeLLM(BaseLLM):
+        """
+        Deterministic answers in each task's JSON schema after a simulated
+        delay of `latency` plus output tokens at `tokens_per_second`;
+        raises a 429 for `error_rate` of calls
+        """
+
+        def __init__(self):
+            super().__init__(model=FAKE_MODEL)
+            self._rng = random.Random(seed)
+            self._lock = threading.Lock()
+            self.calls = 0
+            self.rate_limited = 0
+
+        def call(self, messages, tools=None, callbacks=None, available_functions=None, **kwargs):
+            prompt = messages if isinstance(messages, str) else "\n".join(
+                str(m.get("content", "")) for m in messages
+            )
+            with self._lock:
+                self.calls += 1
+                throttled = self._rng.random() < error_rate
+                self.rate_limited += throttled
+            if throttled:
+                time.sleep(latency / 4)
+                raise FakeRateLimitError("429 Too Many Requests (injected)")
+
+            answer = next(
+                (a for marker, a in FAKE_ANSWERS.items() if marker in prompt), NARRATIVE_ANSWER
+            )
+            text = json.dumps(answer)
+            time.sleep(latency + (len(text) / 4) / tokens_per_second)
+            return f"Thought: I now can give a great answer\nFinal Answer: {text}"
+
+        def supports_function_calling(self) -> bool:
+            return False
+
+        def supports_stop_words(self) -> bool:
+            return False
+
+        def get_context_window_size(self) -> int:
+            return 131072
+
+    return FakeLLM()
+
+
+## Harness
+def configure_environment(workdir: str, args):
+    """
+    Point every store at `workdir` and the pipeline at the fake model.
+    Must run before any repository module is imported.
+    """
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["EXTRACTION_CACHE_DIR"] = os.path.join(workdir, "extractions")
+    os.environ["UPLOAD_DIR"] = os.path.join(workdir, "data")
+    os.environ["LLM_MODEL"] = FAKE_MODEL
+    os.environ["RATE_LIMIT_BACKOFF_SECONDS"] = str(args.backoff)
+    os.environ["INDEX_EMBEDDINGS"] = "0"
+
+    import budget
+    budget.MODEL_LIMITS[FAKE_MODEL] = {
+        "context_tokens": 131072,
+        "request_tokens": 6000,
+        "output_tokens": 1024,
+        "rpm": args.rpm,
+        "tpm": args.tpm,
+    }
+
+
+def install_fake_llm(fake):
+    import agents
+    agents.llm = fake
+    for agent in (agents.financial_analyst, agents.verifier,
+                  agents.investment_advisor, agents.risk_assessor):
+        agent.llm = fake
+
+
+def run_job(job_id: int, file_path: str, content_hash: str, query: str, mode: str) -> dict:
+    """
+    One job through the same steps as extract_document + process_analysis,
+    timed per stage (seconds)
+    """
+    import pipeline
+    from ranking import select_relevant_text
+    from budget import count_tokens, document_token_budget
+    from tools import FinancialDocumentTool
+    from tasks import update_job
+
+    timings = {}
+
+    start = time.perf_counter()
+    text = FinancialDocumentTool().read_with_budget(file_path, pipeline.CANDIDATE_CHARS, content_hash)
+    timings["extract"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    metrics, analytics = pipeline.extract_figures(text)
+    inputs = pipeline._analysis_inputs(query, "", metrics, analytics)
+    token_budget = document_token_budget(
+        pipeline._analysis_task(metrics), query, pipeline.llm.model, inputs
+    )
+    document_text = select_relevant_text(text, query, token_budget, measure=count_tokens)
+    timings["figures_and_truncate"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if mode == "full":
+        parsed, _ = pipeline.run_full_analysis(query, document_text, None, metrics, analytics)
+    else:
+        parsed, _ = pipeline.run_analysis(query, document_text, None, metrics, analytics)
+    timings["crew"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    update_job(job_id, result_json=json.dumps(parsed), status="COMPLETED")
+    timings["persist"] = time.perf_counter() - start
+
+    timings["total"] = sum(timings.values())
+    return timings
+
+
+def run_corpus(pages: int, args, workdir: str) -> dict:
+    from database import session_scope
+    from extraction_cache import file_sha256
+    from models import AnalysisResult
+
+    files = []
+    for i in range(args.documents):
+        path = os.path.join(workdir, f"synthetic-{pages}p-{i}.pdf")
+        write_pdf(path, pages, seed=args.seed + i)
+        files.append((path, file_sha256(path)))
+
+    jobs = []
+    with session_scope() as db:
+        for n in range(args.jobs):
+            path, content_hash = files[n % len(files)]
+            # Distinct queries keep the response cache from answering
+            query = f"Summarize the financial position (run {n})"
+            record = AnalysisResult(file_name=os.path.basename(path), query=query,
+                                    status="PENDING", file_hash=content_hash)
+            db.add(record)
+            db.flush()
+            jobs.append((record.id, path, content_hash, query))
+        db.commit()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(lambda job: run_job(*job, args.mode), jobs))
+    wall = time.perf_counter() - start
+
+    stages = {}
+    for stage in results[0]:
+        samples = np.array([r[stage] for r in results]) * 1e3
+        stages[stage] = {
+            "p50_ms": round(float(np.percentile(samples, 50)), 2),
+            "p95_ms": round(float(np.percentile(samples, 95)), 2),
+        }
+    return {
+        "pages": pages,
+        "documents": len(files),
+        "jobs": len(jobs),
+        "wall_seconds": round(wall, 3),
+        "jobs_per_second": round(len(jobs) / wall, 3),
+        "stages": stages,
+    }
+
+
+def peak_rss_mb() -> dict:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1 / 1024 if sys.platform != "darwin" else 1 / (1024 * 1024)
+    return {
+        "self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale, 1),
+        "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pages", type=int, nargs="+", default=[5, 50, 300])
+    parser.add_argument("--documents", type=int, default=4, help="distinct PDFs per corpus")
+    parser.add_argument("--jobs", type=int, default=20, help="jobs per corpus")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--mode", choices=["single", "full"], default="single")
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds per LLM call")
+    parser.add_argument("--tokens-per-second", type=float, default=500.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of calls answered with 429")
+    parser.add_argument("--backoff", type=float, default=0.05, help="base 429 backoff, seconds")
+    parser.add_argument("--rpm", type=int, default=100000)
+    parser.add_argument("--tpm", type=int, default=100000000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON file (default: stdout)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="e2e-bench-") as workdir:
+        configure_environment(workdir, args)
+        fake = make_fake_llm(args.latency, args.tokens_per_second, args.error_rate, args.seed)
+        install_fake_llm(fake)
+
+        corpora = [run_corpus(pages, args, workdir) for pages in args.pages]
+
+    report = {
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "corpora": corpora,
+        "llm_calls": fake.calls,
+        "rate_limited_calls": fake.rate_limited,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    payload = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(payload + "\n")
+    else:
+        print(payload)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+PDF extraction time, serial vs parallel page ranges.
+
+Run from the repository root with any large PDF:
+
+    python -m benchmarks.extraction_bench data/annual-report.pdf --processes 2 4 8
+"""
+import argparse
+import time
+
+import parallel_extract
+from text_normalize import normalize_text
+
+
+def serial_pages(path: str) -> list:
+    from pypdf import PdfReader
+    return [normalize_text(page.extract_text()) for page in PdfReader(path).pages]
+
+
+def parallel_pages(path: str, processes: int) -> list:
+    parallel_extract.EXTRACTION_PROCESSES = processes
+    parallel_extract.PARALLEL_MIN_PAGES = 0
+    pages = parallel_extract.extract_pages_parallel(path)
+    if pages is None:
+        raise RuntimeError("parallel extraction did not run")
+    return pages
+
+
+def best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("pdf")
+    parser.add_argument("--processes", type=int, nargs="+", default=[2, 4])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    expected = serial_pages(args.pdf)
+    serial = best_of(lambda: serial_pages(args.pdf), args.repeat)
+
+    print(f"{args.pdf}: {len(expected)} pages")
+    print(f"{'mode':<24}{'seconds':>10}{'speedup':>10}")
+    print(f"{'serial':<24}{serial:>10.2f}{1.0:>9.1f}x")
+    for processes in args.processes:
+        # A fresh pool of the requested size; its startup is paid once per
+        # process in production, so the untimed check run absorbs it
+        if parallel_extract._pool is not None:
+            parallel_extract._discard_pool(parallel_extract._pool)
+        if parallel_pages(args.pdf, processes) != expected:
+            raise RuntimeError(f"{processes} processes produced different text")
+        elapsed = best_of(lambda: parallel_pages(args.pdf, processes), args.repeat)
+        print(f"{f'parallel x{processes}':<24}{elapsed:>10.2f}{serial / elapsed:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
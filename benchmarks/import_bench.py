@@ -0,0 +1,89 @@
+"""
+Cold import time of the API and worker entry points.
+
+Run from the repository root:
+
+    python -m benchmarks.import_bench --budget-ms main=1500
+
+Each module is imported in a fresh interpreter with -X importtime. Exits
+non-zero when a module exceeds its budget or pulls in a forbidden
+package, so it can guard against regressions in CI.
+"""
+import argparse
+import subprocess
+import sys
+import time
+
+
+# The API must not load the crew/LLM stack at import time, nor the workers
+# the web stack
+FORBIDDEN = {
+    "main": ["crewai", "langchain_community", "agents", "task", "pipeline", "tools"],
+    "tasks": ["crewai", "langchain_community", "agents", "task", "pipeline", "tools",
+              "fastapi", "uploads"],
+}
+
+
+def import_profile(module: str, repeat: int):
+    """
+    Best wall time in seconds, and {package: cumulative microseconds} for
+    every package the import loaded
+    """
+    best = float("inf")
+    packages = {}
+    for _ in range(repeat):
+        start = time.perf_counter()
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            capture_output=True, text=True,
+        )
+        elapsed = time.perf_counter() - start
+        if completed.returncode != 0:
+            raise RuntimeError(f"import {module} failed:\n{completed.stderr[-2000:]}")
+        if elapsed < best:
+            best = elapsed
+            packages = {}
+            for line in completed.stderr.splitlines():
+                if not line.startswith("import time:") or "|" not in line:
+                    continue
+                _, cumulative, name = line.split("|")
+                if not cumulative.strip().isdigit():
+                    continue
+                # Any depth: a forbidden package pulled in indirectly counts
+                top = name.strip().split(".")[0]
+                packages[top] = max(packages.get(top, 0), int(cumulative))
+    return best, packages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("modules", nargs="*", default=["main", "tasks"])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=8)
+    parser.add_argument(
+        "--budget-ms", action="append", default=[],
+        help="module=milliseconds; fail when the import is slower",
+    )
+    args = parser.parse_args()
+    budgets = {k: float(v) for k, v in (item.split("=", 1) for item in args.budget_ms)}
+
+    failures = []
+    for module in args.modules:
+        elapsed, packages = import_profile(module, args.repeat)
+        print(f"import {module}: {elapsed * 1e3:.0f} ms")
+        for name, micros in sorted(packages.items(), key=lambda kv: -kv[1])[:args.top]:
+            print(f"    {name:<28}{micros / 1e3:>8.0f} ms")
+
+        loaded = [name for name in FORBIDDEN.get(module, []) if name in packages]
+        if loaded:
+            failures.append(f"{module} imports {', '.join(loaded)} at import time")
+        if module in budgets and elapsed * 1e3 > budgets[module]:
+            failures.append(f"{module} took {elapsed * 1e3:.0f} ms (budget {budgets[module]:.0f} ms)")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Throughput of text normalization, legacy loops vs text_normalize.
+
+Run from the repository root:
+
+    python -m benchmarks.normalize_bench --pages 300
+"""
+import argparse
+import random
+import time
+
+from text_normalize import join_pages, normalize_text
+
+
+TABLE_ROWS = [
+    "Total revenues", "Cost of revenues", "Gross profit", "Operating expenses",
+    "Income from operations", "Net income", "Total debt", "Cash and cash equivalents",
+    "Net cash provided by operating activities", "Capital expenditures",
+]
+PROSE = (
+    "During the quarter the company continued to invest in capacity while "
+    "managing working capital and maintaining a strong balance sheet. "
+)
+
+
+def synthetic_page(rng: random.Random) -> str:
+    """
+    One ~3.5 KB page shaped like PyPDFLoader output of a filing: prose
+    paragraphs separated by blank lines and space-aligned tables.
+    """
+    parts = []
+    for _ in range(4):
+        parts.append(PROSE * rng.randint(2, 4))
+        parts.append("\n" * rng.randint(2, 4))
+        for row in rng.sample(TABLE_ROWS, 6):
+            values = "    ".join(f"{rng.randint(100, 99999):,}" for _ in range(4))
+            parts.append(f"{row}{' ' * rng.randint(2, 12)}{values}\n")
+        parts.append("\n\n")
+    return "".join(parts)
+
+
+## Pre-change implementations, kept here only to measure against
+def legacy_join_pages(pages) -> str:
+    full_report = ""
+    for content in pages:
+        while "\n\n" in content:
+            content = content.replace("\n\n", "\n")
+        full_report += content + "\n"
+    return full_report
+
+
+def legacy_remove_double_spaces(processed_data: str) -> str:
+    i = 0
+    while i < len(processed_data):
+        if processed_data[i:i+2] == "  ":
+            processed_data = processed_data[:i] + processed_data[i+1:]
+        else:
+            i += 1
+    return processed_data
+
+
+def legacy_pipeline(pages) -> str:
+    return legacy_remove_double_spaces(legacy_join_pages(pages))
+
+
+def measure(fn, arg, size_bytes: int, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(arg)
+        best = min(best, time.perf_counter() - start)
+    return size_bytes / best / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    pages = [synthetic_page(rng) for _ in range(args.pages)]
+    document = "".join(pages)
+    size_bytes = len(document.encode("utf-8"))
+
+    rows = [
+        ("double spaces (InvestmentTool)", legacy_remove_double_spaces, normalize_text, document),
+        ("extract + clean (both tools)", legacy_pipeline, join_pages, pages),
+    ]
+
+    print(f"{args.pages} pages, {size_bytes / 1e6:.2f} MB")
+    print(f"{'stage':<36}{'before MB/s':>14}{'after MB/s':>14}{'speedup':>10}")
+    for label, before_fn, after_fn, arg in rows:
+        before = measure(before_fn, arg, size_bytes, 1)
+        after = measure(after_fn, arg, size_bytes, args.repeat)
+        print(f"{label:<36}{before:>14.2f}{after:>14.2f}{after / before:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+## Token budgeting for the document text sent to the LLM
+import os
+import re
+from functools import lru_cache
+
+from dotenv import load_dotenv
+load_dotenv()
+
+
+LLM_MODEL = os.getenv("LLM_MODEL", "groq/llama-3.1-8b-instant")
+
+# Per-model limits, the only place they are configured.
+#   context_tokens:  model context window
+#   request_tokens:  largest single request the provider accepts on our
+#                    plan (Groq free tier caps tokens per minute, which
+#                    also bounds one request)
+#   output_tokens:   room reserved for the JSON answer
+#   rpm / tpm:       provider rate limits for our API key
+MODEL_LIMITS = {
+    "groq/llama-3.1-8b-instant": {
+        "context_tokens": 131072,
+        "request_tokens": 6000,
+        "output_tokens": 1024,
+        "rpm": 30,
+        "tpm": 6000,
+    },
+    "groq/llama-3.3-70b-versatile": {
+        "context_tokens": 131072,
+        "request_tokens": 12000,
+        "output_tokens": 1024,
+        "rpm": 30,
+        "tpm": 12000,
+    },
+    "gpt-4o-mini": {
+        "context_tokens": 128000,
+        "request_tokens": 128000,
+        "output_tokens": 2048,
+        "rpm": 500,
+        "tpm": 200000,
+    },
+}
+DEFAULT_LIMITS = MODEL_LIMITS["groq/llama-3.1-8b-instant"]
+
+# CrewAI wraps the task in its own system/user framing (role, goal,
+# backstory, formatting instructions); this covers that scaffolding.
+PROMPT_OVERHEAD_TOKENS = 400
+# The local tokenizer only approximates the provider's, so keep a margin
+SAFETY_MARGIN = 0.1
+
+_PLACEHOLDER = re.compile(r"\{(\w+)\}")
+
+
+def model_limits(model: str = LLM_MODEL) -> dict:
+    return MODEL_LIMITS.get(model, DEFAULT_LIMITS)
+
+
+@lru_cache(maxsize=None)
+def _encoding():
+    # cl100k_base is a close stand-in for the Llama 3 and GPT-4 family
+    # tokenizers. Falls back to a chars/4 estimate when the encoding file
+    # cannot be loaded (e.g. no network on first use).
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+def count_tokens(text: str) -> int:
+    encoding = _encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def template_tokens(task, inputs: dict) -> int:
+    """
+    Tokens the task prompt costs without the document text itself
+    """
+    def fill(match):
+        return str(inputs.get(match.group(1), ""))
+
+    parts = [
+        _PLACEHOLDER.sub(fill, task.description),
+        _PLACEHOLDER.sub(fill, task.expected_output),
+    ]
+    agent = getattr(task, "agent", None)
+    if agent is not None:
+        parts += [agent.role, agent.goal, agent.backstory]
+    return sum(count_tokens(part) for part in parts) + PROMPT_OVERHEAD_TOKENS
+
+
+def document_token_budget(task, query: str, model: str = LLM_MODEL, inputs: dict = None) -> int:
+    """
+    Tokens left for document text once the task template, any other
+    `inputs` it is filled with and the expected output are reserved
+    """
+    limits = model_limits(model)
+    request_tokens = min(limits["context_tokens"], limits["request_tokens"])
+    usable = int(request_tokens * (1 - SAFETY_MARGIN))
+
+    reserved = template_tokens(task, {**(inputs or {}), "query": query}) + limits["output_tokens"]
+    return max(usable - reserved, 0)
@@ -1,7 +1,52 @@
+import os
 from celery import Celery
 
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# PDF parsing is CPU-bound and crew calls are network-bound, so they run on
+# separate queues served by separately sized workers:
+#   celery -A tasks.celery worker -Q extraction --pool=threads --concurrency=4
+#   celery -A tasks.celery worker -Q llm --pool=threads --concurrency=32
+# Extraction threads hand every PDF to parallel_extract's process pool
+# (EXTRACTION_PROCESSES, one per core); prefork children cannot start it.
+EXTRACTION_QUEUE = os.getenv("EXTRACTION_QUEUE", "extraction")
+LLM_QUEUE = os.getenv("LLM_QUEUE", "llm")
+
+# Batch and other bulk jobs run in a lane of their own, so a large backlog
+# never sits in front of interactive requests. Workers list the
+# interactive queue first (-Q llm,llm.bulk) and always drain it first.
+EXTRACTION_BULK_QUEUE = os.getenv("EXTRACTION_BULK_QUEUE", "extraction.bulk")
+LLM_BULK_QUEUE = os.getenv("LLM_BULK_QUEUE", "llm.bulk")
+
+# Longest a job may take, retry backoff included. Tasks are acknowledged
+# late, and Redis hands a task still unacknowledged after this long to
+# another worker, so it must exceed the slowest map-reduce run (a long
+# filing at a free-tier token limit takes hours).
+JOB_TIMEOUT_SECONDS = int(os.getenv("JOB_TIMEOUT_SECONDS", str(6 * 3600)))
+
+# lane: (extraction queue, LLM queue)
+LANE_QUEUES = {
+    "interactive": (EXTRACTION_QUEUE, LLM_QUEUE),
+    "bulk": (EXTRACTION_BULK_QUEUE, LLM_BULK_QUEUE),
+}
+
 celery = Celery(
     "worker",
-    broker="redis://localhost:6379/0",
-    backend="redis://localhost:6379/0"
-)
\ No newline at end of file
+    broker=REDIS_URL,
+    backend=REDIS_URL
+)
+
+# Defaults; tasks.analysis_pipeline sends each job to its lane's queues
+celery.conf.task_routes = {
+    "tasks.extract_document": {"queue": EXTRACTION_QUEUE},
+    "tasks.index_document": {"queue": EXTRACTION_BULK_QUEUE},
+    "tasks.process_analysis": {"queue": LLM_QUEUE},
+}
+celery.conf.broker_transport_options = {
+    # Poll a worker's queues in the order given to -Q instead of round robin
+    "queue_order_strategy": "priority",
+    "visibility_timeout": JOB_TIMEOUT_SECONDS,
+}
+# A prefork child holding several prefetched PDFs would delay them behind
+# the one it is parsing; take one at a time
+celery.conf.worker_prefetch_multiplier = 1
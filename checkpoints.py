@@ -0,0 +1,42 @@
+## Per-stage checkpoints of in-flight jobs
+import json
+from datetime import datetime
+
+from database import session_scope
+from models import JobCheckpoint
+
+
+class JobCheckpoints:
+    """
+    Outputs of a job's completed stages ("verification", "analysis",
+    "chunk:3", ...), stored in the `job_checkpoints` table by job id.
+
+    A job retried after a transient error, or redelivered after its
+    worker died, reads them back and skips the stages already done.
+    They are cleared once the job reaches a final status.
+    """
+
+    def __init__(self, job_id: int):
+        self.job_id = job_id
+
+    def get(self, stage: str):
+        with session_scope() as db:
+            entry = db.get(JobCheckpoint, (self.job_id, stage))
+            return json.loads(entry.payload_json) if entry is not None else None
+
+    def put(self, stage: str, payload):
+        with session_scope() as db:
+            db.merge(JobCheckpoint(
+                job_id=self.job_id,
+                stage=stage,
+                payload_json=json.dumps(payload),
+                created_at=datetime.utcnow(),
+            ))
+            db.commit()
+
+    def clear(self):
+        with session_scope() as db:
+            db.query(JobCheckpoint).filter(
+                JobCheckpoint.job_id == self.job_id
+            ).delete(synchronize_session=False)
+            db.commit()
@@ -0,0 +1,39 @@
+## Coalescing of identical analysis requests
+import hashlib
+
+from models import AnalysisResult
+from response_cache import normalize_query
+
+
+IN_FLIGHT_STATUSES = ("PENDING", "PROCESSING")
+
+# "single" sends the most relevant sections in one prompt, "map_reduce"
+# analyzes the whole document chunk by chunk and merges the results, "full"
+# verifies the document and then runs analysis, investment and risk
+# tasks concurrently
+ANALYSIS_MODES = ("single", "map_reduce", "full")
+
+
+def make_request_key(content_hash: str, query: str, mode: str) -> str:
+    """
+    Identical file bytes, normalized query and mode produce the same result
+    """
+    parts = [content_hash, normalize_query(query), mode]
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+def find_reusable_job(db, request_key: str):
+    """
+    Latest job for the same request that is completed or still running.
+    Failed jobs are never reused, so resubmitting retries them.
+    """
+    return (
+        db.query(AnalysisResult)
+        .filter(
+            AnalysisResult.request_key == request_key,
+            AnalysisResult.duplicate_of.is_(None),
+            AnalysisResult.status.in_(IN_FLIGHT_STATUSES + ("COMPLETED",)),
+        )
+        .order_by(AnalysisResult.id.desc())
+        .first()
+    )
@@ -0,0 +1,294 @@
+## Persistent search index over processed documents
+import os
+import json
+import threading
+from collections import Counter
+from functools import lru_cache
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from dotenv import load_dotenv
+load_dotenv()
+
+from database import session_scope
+from models import IndexedDocument, IndexedSection, IndexPosting
+from ranking import BM25_B, BM25_K1, STOPWORDS, split_sections, tokenize
+from metrics_extractor import LINE_ITEMS, extract_line_items
+
+
+# Section embeddings with chromadb's default CPU model (all-MiniLM-L6-v2
+# on ONNX). Off, or when the model cannot be loaded, search is keyword-only.
+INDEX_EMBEDDINGS = os.getenv("INDEX_EMBEDDINGS", "1") == "1"
+
+# Share of the final score that comes from embedding similarity
+SEMANTIC_WEIGHT = 0.5
+# Semantic candidates considered per requested result
+SEMANTIC_CANDIDATES = 5
+SNIPPET_CHARS = 400
+
+
+@lru_cache(maxsize=None)
+def _embedding_function():
+    if not INDEX_EMBEDDINGS:
+        return None
+    try:
+        from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+        return DefaultEmbeddingFunction()
+    except Exception:
+        return None
+
+
+def embed(texts: list):
+    """
+    Unit-length float32 embeddings, one row per text, or None without a
+    model
+    """
+    embedding_function = _embedding_function()
+    if embedding_function is None or not texts:
+        return None
+    try:
+        vectors = np.asarray(embedding_function(texts), dtype=np.float32)
+    except Exception:
+        return None
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _index_terms(text: str) -> list:
+    return [t for t in tokenize(text) if t not in STOPWORDS]
+
+
+def _matching_items(terms: list) -> list:
+    """
+    Line items whose name shares a term with the query, e.g. "debt" ->
+    total_debt
+    """
+    wanted = set(terms)
+    return [name for name in LINE_ITEMS if wanted & set(name.split("_"))]
+
+
+class DocumentIndex:
+    """
+    Inverted index (term -> section postings) plus per-section embeddings
+    over every document the workers have extracted, stored in the
+    database next to the jobs.
+
+    Documents are keyed by content hash and added once; adding one only
+    writes its own rows. Each process keeps the embedding matrix in
+    memory and loads just the sections added since its last search.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._vector_ids = np.empty(0, dtype=np.int64)
+        self._vectors = None
+        self._loaded_up_to = 0
+
+    def is_indexed(self, content_hash: str) -> bool:
+        with session_scope() as db:
+            return db.get(IndexedDocument, content_hash) is not None
+
+    def add_document(self, content_hash: str, file_name: str, text: str) -> int:
+        """
+        Index one document's sections; returns how many were added (0 if
+        the document was already indexed)
+        """
+        if self.is_indexed(content_hash):
+            return 0
+
+        sections = split_sections(text)
+        # Embedding runs before the write so no transaction is held open
+        vectors = embed(sections)
+
+        with session_scope() as db:
+            try:
+                db.add(IndexedDocument(
+                    content_hash=content_hash,
+                    file_name=file_name,
+                    section_count=len(sections),
+                    line_items_json=json.dumps(extract_line_items(text)),
+                ))
+
+                rows = []
+                for position, section in enumerate(sections):
+                    terms = _index_terms(section)
+                    rows.append((IndexedSection(
+                        content_hash=content_hash,
+                        position=position,
+                        text=section,
+                        token_count=len(terms),
+                        embedding=vectors[position].tobytes() if vectors is not None else None,
+                    ), Counter(terms)))
+                db.add_all([row for row, _ in rows])
+                db.flush()
+
+                db.bulk_insert_mappings(IndexPosting, [
+                    {"term": term, "section_id": row.id, "frequency": frequency}
+                    for row, counts in rows
+                    for term, frequency in counts.items()
+                ])
+                db.commit()
+            except IntegrityError:
+                # Another worker indexed the same document first
+                db.rollback()
+                return 0
+
+        return len(sections)
+
+    def _refresh_vectors(self, db):
+        with self._lock:
+            new = (
+                db.query(IndexedSection.id, IndexedSection.embedding)
+                .filter(IndexedSection.id > self._loaded_up_to)
+                .filter(IndexedSection.embedding.isnot(None))
+                .order_by(IndexedSection.id)
+                .all()
+            )
+            if not new:
+                return
+
+            ids = np.array([row.id for row in new], dtype=np.int64)
+            vectors = np.stack([np.frombuffer(row.embedding, dtype=np.float32) for row in new])
+            if self._vectors is None:
+                self._vectors = vectors
+            else:
+                self._vectors = np.vstack([self._vectors, vectors])
+            self._vector_ids = np.concatenate([self._vector_ids, ids])
+            self._loaded_up_to = int(ids[-1])
+
+    def _keyword_scores(self, db, terms: list, hashes) -> dict:
+        """
+        BM25 score per section id for `terms`, from the postings table
+        """
+        sections = db.query(IndexedSection)
+        postings = (
+            db.query(IndexPosting.term, IndexPosting.section_id,
+                     IndexPosting.frequency, IndexedSection.token_count)
+            .join(IndexedSection, IndexedSection.id == IndexPosting.section_id)
+            .filter(IndexPosting.term.in_(terms))
+        )
+        if hashes is not None:
+            sections = sections.filter(IndexedSection.content_hash.in_(hashes))
+            postings = postings.filter(IndexedSection.content_hash.in_(hashes))
+
+        total, average_length = sections.with_entities(
+            func.count(IndexedSection.id), func.avg(IndexedSection.token_count)
+        ).one()
+        rows = postings.all()
+        if not rows:
+            return {}
+
+        section_ids = np.array([row.section_id for row in rows])
+        term_ids = np.unique([row.term for row in rows], return_inverse=True)[1]
+        frequency = np.array([row.frequency for row in rows], dtype=np.float32)
+        lengths = np.array([row.token_count for row in rows], dtype=np.float32)
+
+        doc_freq = np.bincount(term_ids)
+        idf = np.log1p((total - doc_freq + 0.5) / (doc_freq + 0.5))
+        norm = BM25_K1 * (1.0 - BM25_B + BM25_B * lengths / max(float(average_length or 1), 1.0))
+        contribution = idf[term_ids] * frequency * (BM25_K1 + 1.0) / (frequency + norm)
+
+        unique_ids, inverse = np.unique(section_ids, return_inverse=True)
+        scores = np.bincount(inverse, weights=contribution)
+        return dict(zip(unique_ids.tolist(), scores.tolist()))
+
+    def _semantic_scores(self, db, query: str, hashes, limit: int) -> dict:
+        query_vector = embed([query])
+        if query_vector is None:
+            return {}
+        self._refresh_vectors(db)
+        if self._vectors is None:
+            return {}
+
+        similarity = self._vectors @ query_vector[0]
+        ids = self._vector_ids
+        if hashes is not None:
+            allowed = {
+                row.id for row in
+                db.query(IndexedSection.id).filter(IndexedSection.content_hash.in_(hashes))
+            }
+            mask = np.fromiter((i in allowed for i in ids.tolist()), dtype=bool, count=len(ids))
+            similarity, ids = similarity[mask], ids[mask]
+
+        top = np.argsort(-similarity)[:limit]
+        return {int(ids[i]): max(float(similarity[i]), 0.0) for i in top}
+
+    def search(self, query: str, file_name: str = None, limit: int = 10) -> list:
+        """
+        Sections most relevant to `query`, grouped by document, across
+        every indexed document (or those whose file name contains
+        `file_name`). Each document also lists its extracted line items
+        that the query names, with their values per period.
+        """
+        terms = list(dict.fromkeys(_index_terms(query)))
+
+        with session_scope() as db:
+            documents = db.query(IndexedDocument)
+            if file_name:
+                documents = documents.filter(IndexedDocument.file_name.ilike(f"%{file_name}%"))
+            documents = {d.content_hash: d for d in documents.all()}
+            if not documents:
+                return []
+            hashes = list(documents) if file_name else None
+
+            keyword = self._keyword_scores(db, terms, hashes) if terms else {}
+            semantic = self._semantic_scores(db, query, hashes, limit * SEMANTIC_CANDIDATES)
+
+            # BM25 is unbounded; scale it to [0, 1] before mixing with cosine
+            top_keyword = max(keyword.values(), default=0.0) or 1.0
+            weight = SEMANTIC_WEIGHT if semantic else 0.0
+            scores = {
+                section_id: (1 - weight) * keyword.get(section_id, 0.0) / top_keyword
+                + weight * semantic.get(section_id, 0.0)
+                for section_id in set(keyword) | set(semantic)
+            }
+            best = sorted(scores, key=scores.get, reverse=True)[:limit]
+            sections = {
+                s.id: s for s in db.query(IndexedSection).filter(IndexedSection.id.in_(best))
+            }
+
+            results = {}
+            for section_id in best:
+                section = sections[section_id]
+                entry = results.setdefault(section.content_hash, {
+                    "content_hash": section.content_hash,
+                    "file_name": documents[section.content_hash].file_name,
+                    "score": round(scores[section_id], 4),
+                    "sections": [],
+                })
+                entry["sections"].append({
+                    "position": section.position,
+                    "score": round(scores[section_id], 4),
+                    "text": section.text[:SNIPPET_CHARS],
+                })
+
+            # Figures the query asks for come from every matching document,
+            # even ones none of whose text made the top sections
+            wanted = _matching_items(terms)
+            for content_hash, document in documents.items():
+                items = json.loads(document.line_items_json or "{}")
+                found = {name: items[name] for name in wanted if name in items}
+                if not found:
+                    continue
+                entry = results.setdefault(content_hash, {
+                    "content_hash": content_hash,
+                    "file_name": document.file_name,
+                    "score": 0.0,
+                    "sections": [],
+                })
+                entry["line_items"] = found
+
+        return list(results.values())
+
+    def stats(self) -> dict:
+        with session_scope() as db:
+            return {
+                "documents": db.query(IndexedDocument).count(),
+                "sections": db.query(IndexedSection).count(),
+                "terms": db.query(func.count(func.distinct(IndexPosting.term))).scalar(),
+                "embeddings": db.query(IndexedSection).filter(IndexedSection.embedding.isnot(None)).count(),
+            }
+
+
+document_index = DocumentIndex()
@@ -0,0 +1,110 @@
+## Job status events: Redis pub/sub with an in-process fallback
+import json
+import time
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+
+import redis
+import redis.asyncio as aioredis
+
+from celery_app import REDIS_URL
+
+
+TERMINAL_STATUSES = ("COMPLETED", "FAILED")
+
+# Latest event per job is kept so a client that connects mid-job starts
+# from the current stage instead of waiting for the next transition
+LAST_EVENT_TTL_SECONDS = 3600
+
+_redis = redis.Redis.from_url(REDIS_URL, socket_timeout=0.5, socket_connect_timeout=0.5)
+_async_redis = aioredis.from_url(REDIS_URL, socket_connect_timeout=0.5)
+
+# job_id -> set of (loop, queue) for subscribers in this process
+_local_subscribers = {}
+_local_lock = threading.Lock()
+
+
+def _channel(job_id) -> str:
+    return f"job:{job_id}:events"
+
+
+def _last_key(job_id) -> str:
+    return f"job:{job_id}:last"
+
+
+def publish_event(job_id, status: str, stage: str = None, **extra):
+    """
+    Publish a status transition or progress step for a job
+    """
+    event = {"job_id": job_id, "status": status, "stage": stage, "ts": time.time(), **extra}
+    payload = json.dumps(event)
+
+    try:
+        pipe = _redis.pipeline()
+        pipe.set(_last_key(job_id), payload, ex=LAST_EVENT_TTL_SECONDS)
+        pipe.publish(_channel(job_id), payload)
+        pipe.execute()
+        return
+    except redis.RedisError:
+        pass
+
+    # No Redis: deliver to subscribers in this process only
+    with _local_lock:
+        subscribers = list(_local_subscribers.get(job_id, ()))
+    for loop, queue in subscribers:
+        loop.call_soon_threadsafe(queue.put_nowait, event)
+
+
+async def last_event(job_id):
+    try:
+        payload = await _async_redis.get(_last_key(job_id))
+    except redis.RedisError:
+        return None
+    return json.loads(payload) if payload else None
+
+
+@asynccontextmanager
+async def subscription(job_id):
+    """
+    Queue receiving a job's events for the duration of the block.
+    Subscribe before reading the job's current state so no transition
+    falls between the two.
+    """
+    queue = asyncio.Queue()
+    entry = (asyncio.get_running_loop(), queue)
+    with _local_lock:
+        _local_subscribers.setdefault(job_id, set()).add(entry)
+
+    pubsub = _async_redis.pubsub()
+    listener = None
+    try:
+        try:
+            await pubsub.subscribe(_channel(job_id))
+            listener = asyncio.ensure_future(_forward(pubsub, queue))
+        except redis.RedisError:
+            pass
+
+        yield queue
+
+    finally:
+        if listener is not None:
+            listener.cancel()
+        with _local_lock:
+            _local_subscribers[job_id].discard(entry)
+            if not _local_subscribers[job_id]:
+                del _local_subscribers[job_id]
+        try:
+            await pubsub.aclose()
+        except redis.RedisError:
+            pass
+
+
+async def _forward(pubsub, queue):
+    try:
+        async for message in pubsub.listen():
+            if message["type"] == "message":
+                queue.put_nowait(json.loads(message["data"]))
+    except redis.RedisError:
+        # Redis went away; heartbeats in the stream fall back to the database
+        pass
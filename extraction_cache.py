@@ -0,0 +1,173 @@
+## Content-addressed cache for extracted PDF text
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+import redis
+from dotenv import load_dotenv
+load_dotenv()
+
+from celery_app import REDIS_URL
+
+
+CACHE_DIR = os.getenv("EXTRACTION_CACHE_DIR", "cache/extractions")
+CACHE_MAX_BYTES = int(os.getenv("EXTRACTION_CACHE_MAX_MB", "512")) * 1024 * 1024
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# API and Celery workers each hold their own cache object, so the hit/miss
+# counters are mirrored into Redis to get totals across processes.
+STATS_KEY = "extraction_cache:stats"
+
+
+def file_sha256(path: str) -> str:
+    """
+    SHA-256 of the file bytes, read in fixed-size chunks
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ExtractionCache:
+    """
+    Disk-backed LRU store of extracted document text.
+
+    Entries live in `cache_dir` as `<key>.txt`. The in-memory index keeps
+    them in least-recently-used order and evicts from the front once the
+    total size goes over `max_bytes`. File mtimes are bumped on every hit
+    so the LRU order survives process restarts.
+    """
+
+    def __init__(self, cache_dir: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._index = OrderedDict()
+        self._total_bytes = 0
+        self._redis = redis.Redis.from_url(
+            REDIS_URL, socket_timeout=0.5, socket_connect_timeout=0.5
+        )
+        self._load_index()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.txt")
+
+    def _count(self, field: str):
+        try:
+            self._redis.hincrby(STATS_KEY, field, 1)
+        except redis.RedisError:
+            pass
+
+    def _load_index(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".txt"):
+                continue
+            stat = os.stat(os.path.join(self.cache_dir, name))
+            entries.append((stat.st_mtime, name[:-4], stat.st_size))
+
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._total_bytes += size
+
+    def get(self, key: str, count_miss: bool = True):
+        """
+        Cached text, or None. `count_miss=False` is for a lookup with a
+        fallback key, so a miss on both counts once.
+        """
+        with self._lock:
+            path = self._path(key)
+            if key not in self._index and os.path.exists(path):
+                # Written by another worker process since we loaded the index
+                size = os.path.getsize(path)
+                self._index[key] = size
+                self._total_bytes += size
+
+            if key not in self._index:
+                self._miss(count_miss)
+                return None
+
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    text = f.read()
+                os.utime(path)
+            except FileNotFoundError:
+                # Evicted by another worker process
+                self._total_bytes -= self._index.pop(key)
+                self._miss(count_miss)
+                return None
+
+            self._index.move_to_end(key)
+            self.hits += 1
+            self._count("hits")
+            return text
+
+    def _miss(self, counted: bool):
+        if counted:
+            self.misses += 1
+            self._count("misses")
+
+    def put(self, key: str, text: str):
+        data = text.encode("utf-8")
+
+        with self._lock:
+            if len(data) > self.max_bytes:
+                return
+
+            path = self._path(key)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+            if key in self._index:
+                self._total_bytes -= self._index.pop(key)
+            self._index[key] = len(data)
+            self._total_bytes += len(data)
+
+            self._evict()
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and self._index:
+            key, size = self._index.popitem(last=False)
+            self._total_bytes -= size
+            self.evictions += 1
+            self._count("evictions")
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            totals = {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+            try:
+                shared = self._redis.hgetall(STATS_KEY)
+                totals = {k: int(shared.get(k.encode(), 0)) for k in totals}
+            except redis.RedisError:
+                pass
+
+            lookups = totals["hits"] + totals["misses"]
+            return {
+                **totals,
+                "hit_rate": round(totals["hits"] / lookups, 4) if lookups else 0.0,
+                "entries": len(self._index),
+                "size_bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+extraction_cache = ExtractionCache()
@@ -0,0 +1,106 @@
+## Prometheus text exposition of the per-job instrumentation
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from models import AnalysisResult
+
+
+# Stage latency summaries cover jobs finished in this window; the counters
+# cover every job ever recorded
+METRICS_WINDOW_SECONDS = int(os.getenv("METRICS_WINDOW_SECONDS", "3600"))
+QUANTILES = (0.5, 0.95)
+
+PREFIX = "financial_analyzer"
+
+# name: (help, column summed over all jobs)
+COUNTERS = {
+    "prompt_tokens_total": ("Prompt tokens sent to the LLM", AnalysisResult.prompt_tokens),
+    "completion_tokens_total": ("Completion tokens returned by the LLM", AnalysisResult.completion_tokens),
+    "llm_calls_total": ("Crew calls made", AnalysisResult.llm_calls),
+    "llm_retries_total": ("Crew calls retried after a rate limit", AnalysisResult.llm_retries),
+    "output_repairs_total": ("Re-prompts for fields that failed output validation", AnalysisResult.output_repairs),
+    "task_retries_total": ("Job retries after a transient failure", AnalysisResult.task_retries),
+    "pages_total": ("PDF pages extracted", AnalysisResult.pages),
+    "characters_total": ("Characters of document text extracted", AnalysisResult.characters),
+    "upload_bytes_total": ("Bytes uploaded", AnalysisResult.upload_bytes),
+}
+
+
+def _seconds(start, end):
+    if start is None or end is None:
+        return None
+    return max((end - start).total_seconds(), 0.0)
+
+
+# stage: seconds for one job; queue waits are gaps between timestamps
+STAGES = {
+    "upload": lambda job: job.upload_seconds,
+    "bulk_slot_wait": lambda job: _seconds(job.created_at, job.enqueued_at),
+    "extraction_queue_wait": lambda job: _seconds(job.enqueued_at, job.started_at),
+    "extraction": lambda job: job.extraction_seconds,
+    "llm_queue_wait": lambda job: _seconds(job.extracted_at, job.llm_started_at),
+    "llm": lambda job: job.llm_seconds,
+    "persist": lambda job: job.persist_seconds,
+    "total": lambda job: _seconds(job.created_at, job.finished_at),
+}
+
+
+def quantile(values: list, q: float) -> float:
+    # Nearest rank on sorted values
+    index = min(int(q * len(values)), len(values) - 1)
+    return values[index]
+
+
+def _metric(lines: list, name: str, kind: str, help_text: str):
+    lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+    lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+
+
+def render_prometheus(db: Session) -> str:
+    lines = []
+
+    _metric(lines, "jobs", "gauge", "Jobs by current status")
+    # Requests attached to an identical job share its status; count it once
+    jobs = db.query(AnalysisResult.status, func.count()).filter(AnalysisResult.duplicate_of.is_(None))
+    for status, count in jobs.group_by(AnalysisResult.status):
+        lines.append(f'{PREFIX}_jobs{{status="{status}"}} {count}')
+
+    for name, (help_text, column) in COUNTERS.items():
+        _metric(lines, name, "counter", help_text)
+        lines.append(f"{PREFIX}_{name} {db.query(func.coalesce(func.sum(column), 0)).scalar()}")
+
+    _metric(lines, "cache_hits_total", "counter", "Jobs served from a cache")
+    response_hits = db.query(func.count()).filter(AnalysisResult.from_cache.is_(True)).scalar()
+    extraction_hits = db.query(func.count()).filter(AnalysisResult.extraction_cache_hit.is_(True)).scalar()
+    lines.append(f'{PREFIX}_cache_hits_total{{cache="response"}} {response_hits}')
+    lines.append(f'{PREFIX}_cache_hits_total{{cache="extraction"}} {extraction_hits}')
+
+    since = datetime.utcnow() - timedelta(seconds=METRICS_WINDOW_SECONDS)
+    finished = db.query(AnalysisResult).filter(AnalysisResult.finished_at >= since).all()
+
+    _metric(
+        lines, "stage_seconds", "summary",
+        f"Per-stage latency of jobs finished in the last {METRICS_WINDOW_SECONDS}s",
+    )
+    by_lane = {}
+    for job in finished:
+        # Jobs from before lanes existed were all interactive
+        by_lane.setdefault(job.lane or "interactive", []).append(job)
+
+    for lane, jobs in sorted(by_lane.items()):
+        for stage, seconds in STAGES.items():
+            values = sorted(v for v in (seconds(job) for job in jobs) if v is not None)
+            labels = f'lane="{lane}",stage="{stage}"'
+            for q in QUANTILES:
+                value = f"{quantile(values, q):.6f}" if values else "NaN"
+                lines.append(f'{PREFIX}_stage_seconds{{{labels},quantile="{q}"}} {value}')
+            lines.append(f'{PREFIX}_stage_seconds_sum{{{labels}}} {sum(values):.6f}')
+            lines.append(f'{PREFIX}_stage_seconds_count{{{labels}}} {len(values)}')
+
+    return "\n".join(lines) + "\n"
@@ -1,18 +1,21 @@
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Request, Depends
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 import os
+import time
 import uuid
 import json
+import asyncio
+from datetime import datetime
+from typing import List
 
-from crewai import Crew, Process
-from agents import financial_analyst
-from task import analyze_financial_document
-from tools import FinancialDocumentTool
+# The crew/LLM stack (crewai, langchain, agents, tasks) is imported on
+# first use only: the API process never runs a crew itself
+from extraction_cache import extraction_cache
 
 app = FastAPI(title="Financial Document Analyzer")
-from database import engine
-from models import Base
+from database import init_db
 
-Base.metadata.create_all(bind=engine)
+init_db()
 
 
 def run_crew(query: str, file_path: str):
@@ -20,25 +23,15 @@ def run_crew(query: str, file_path: str):
     Backend-controlled PDF loading + safe truncation
     """
 
+    from pipeline import prepare_document, run_analysis
+
     # 1️⃣ Extract PDF text
-    tool = FinancialDocumentTool()
-    document_text = tool._run(file_path)
-
-    # 2️⃣ Prevent token overflow (Groq free-tier safe)
-    MAX_CHARS = 8000
-    document_text = document_text[:MAX_CHARS]
-
-    # 3️⃣ Run Crew
-    financial_crew = Crew(
-        agents=[financial_analyst],
-        tasks=[analyze_financial_document],
-        process=Process.sequential,
-    )
+    # 2️⃣ Read tabular metrics and keep the most relevant sections within
+    #    the token budget
+    document_text, metrics, analytics = prepare_document(file_path, query)
 
-    result = financial_crew.kickoff({
-        "query": query,
-        "document_text": document_text
-    })
+    # 3️⃣ Run Crew (or reuse a cached response)
+    result, _ = run_analysis(query, document_text, metrics=metrics, analytics=analytics)
 
     return result
 
@@ -107,60 +100,423 @@ async def root():
 #             except:
 #                 pass
 
-from database import SessionLocal
-from models import AnalysisResult
-from tasks import process_analysis
+from sqlalchemy.orm import Session
 
-@app.post("/analyze")
-async def analyze_financial_endpoint(file: UploadFile = File(...), query: str = Form(...)):
-
-    db = SessionLocal()
-
-    file_id = str(uuid.uuid4())
-    file_path = f"data/{file_id}.pdf"
+from database import get_db
+from models import AnalysisResult
+from tasks import dispatch_analysis, schedule_bulk
+from uploads import (
+    BATCH_TOO_LARGE,
+    MAX_BATCH_UPLOAD_BYTES,
+    MAX_UPLOAD_BYTES,
+    UPLOAD_TOO_LARGE,
+    save_upload,
+    upload_too_large,
+)
+from dedup import ANALYSIS_MODES, find_reusable_job, make_request_key
+from database import SessionLocal
+from events import TERMINAL_STATUSES, last_event, subscription
+from document_index import document_index
+from job_metrics import render_prometheus
+from scheduler import LANES, choose_lane, promote, queue_stats
+
+
+# path: (request size limit, error detail)
+UPLOAD_LIMITS = {
+    "/analyze": (MAX_UPLOAD_BYTES, UPLOAD_TOO_LARGE),
+    "/analyze/batch": (MAX_BATCH_UPLOAD_BYTES, BATCH_TOO_LARGE),
+}
+
+
+@app.middleware("http")
+async def reject_oversize_uploads(request: Request, call_next):
+    # Runs before the multipart body is parsed, so oversize uploads are
+    # refused without being spooled anywhere. save_upload enforces the
+    # per-file limit inside a batch.
+    limit = UPLOAD_LIMITS.get(request.url.path)
+    if request.method == "POST" and limit is not None:
+        max_bytes, detail = limit
+        if upload_too_large(request.headers.get("content-length"), max_bytes):
+            return JSONResponse(status_code=413, content={"detail": detail})
+    return await call_next(request)
+
+def _check_mode(mode: str):
+    if mode not in ANALYSIS_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown mode '{mode}'. Expected one of: {', '.join(ANALYSIS_MODES)}"
+        )
+
+
+def _client_id(request: Request) -> str:
+    # Fair share is per client; callers behind one gateway identify
+    # themselves with X-Client-Id
+    client_id = request.headers.get("x-client-id", "").strip()
+    if client_id:
+        return client_id[:128]
+    return request.client.host if request.client else "anonymous"
 
-    os.makedirs("data", exist_ok=True)
 
-    with open(file_path, "wb") as f:
-        f.write(await file.read())
+@app.post("/analyze")
+async def analyze_financial_endpoint(
+    request: Request,
+    file: UploadFile = File(...),
+    query: str = Form(...),
+    mode: str = Form(default="single"),
+    lane: str = Form(default="interactive"),
+    db: Session = Depends(get_db),
+):
+
+    _check_mode(mode)
+    if lane not in LANES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown lane '{lane}'. Expected one of: {', '.join(LANES)}"
+        )
+
+    # Streamed to disk in chunks and hashed on the way
+    upload_start = time.perf_counter()
+    file_path, content_hash, size = await save_upload(file)
+    upload_seconds = time.perf_counter() - upload_start
+
+    # Same file, query and mode as an earlier job: reuse it
+    request_key = make_request_key(content_hash, query, mode)
+    existing = find_reusable_job(db, request_key)
+
+    if existing is not None and existing.status == "COMPLETED":
+        return {
+            "job_id": existing.id,
+            "status": existing.status,
+            "deduplicated": True,
+            "result": json.loads(existing.result_json) if existing.result_json else None,
+            "message": "Identical analysis already completed."
+        }
+
+    client_id = _client_id(request)
+    # A client already at its interactive limit is queued as bulk
+    if lane == "interactive":
+        lane = choose_lane(db, client_id)
 
     new_record = AnalysisResult(
         file_name=file.filename,
         query=query,
-        status="PENDING"
+        status="PENDING",
+        file_hash=content_hash,
+        request_key=request_key,
+        duplicate_of=existing.id if existing is not None else None,
+        mode=mode,
+        client_id=client_id,
+        lane=lane,
+        upload_bytes=size,
+        upload_seconds=upload_seconds,
+        enqueued_at=datetime.utcnow() if existing is None and lane == "interactive" else None,
     )
 
     db.add(new_record)
     db.commit()
     db.refresh(new_record)
 
-    # 🔥 Send to background worker
-    process_analysis.delay(new_record.id, query, file_path)
+    if existing is not None:
+        # An interactive request must not wait behind the bulk backlog for
+        # an identical job that has no slot yet; that job runs now instead
+        if lane == "interactive" and promote(db, existing.id):
+            dispatch_analysis(
+                existing.id, existing.query, file_path, existing.mode or mode, content_hash
+            )
+        return {
+            "job_id": new_record.id,
+            "status": existing.status,
+            "deduplicated": True,
+            "message": f"Attached to identical job {existing.id} already in progress. "
+                       "Use /status/{job_id} to check progress."
+        }
 
-    db.close()
+    # 🔥 Send to background worker
+    if lane == "interactive":
+        dispatch_analysis(new_record.id, query, file_path, mode, content_hash)
+    else:
+        await asyncio.to_thread(schedule_bulk)
 
     return {
         "job_id": new_record.id,
         "status": "PENDING",
+        "lane": lane,
         "message": "Analysis started. Use /status/{job_id} to check progress."
     }
-    
-    
+
+
+MAX_BATCH_FILES = int(os.getenv("MAX_BATCH_FILES", "100"))
+
+
+@app.post("/analyze/batch")
+async def analyze_batch_endpoint(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    query: str = Form(...),
+    mode: str = Form(default="single"),
+    db: Session = Depends(get_db),
+):
+    """
+    Analyze many documents with one shared query. All jobs are inserted in
+    one transaction in the bulk lane, and are dispatched as bulk slots free
+    up, taking turns with other clients' bulk jobs.
+    """
+    _check_mode(mode)
+    if len(files) > MAX_BATCH_FILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"A batch may contain at most {MAX_BATCH_FILES} files"
+        )
+
+    batch_id = str(uuid.uuid4())
+    upload_start = time.perf_counter()
+    uploads = [(file.filename, *(await save_upload(file))) for file in files]
+    # Uploads arrive in one request; each job gets its share of the time
+    upload_seconds = (time.perf_counter() - upload_start) / max(len(uploads), 1)
+
+    client_id = _client_id(request)
+    records = []
+    dispatched = 0
+    # Jobs created earlier in this batch, for files repeated within it
+    batch_leaders = {}
+
+    for file_name, _, content_hash, size in uploads:
+        request_key = make_request_key(content_hash, query, mode)
+        leader = batch_leaders.get(request_key) or find_reusable_job(db, request_key)
+
+        record = AnalysisResult(
+            file_name=file_name,
+            query=query,
+            status="PENDING",
+            file_hash=content_hash,
+            request_key=request_key,
+            duplicate_of=leader.id if leader is not None else None,
+            batch_id=batch_id,
+            mode=mode,
+            client_id=client_id,
+            lane="bulk",
+            upload_bytes=size,
+            upload_seconds=upload_seconds,
+        )
+        db.add(record)
+        db.flush()
+        records.append(record)
+
+        if leader is None:
+            batch_leaders[request_key] = record
+            dispatched += 1
+
+    db.commit()
+
+    if dispatched:
+        await asyncio.to_thread(schedule_bulk)
+
+    return {
+        "batch_id": batch_id,
+        "job_ids": [record.id for record in records],
+        "dispatched": dispatched,
+        "deduplicated": len(records) - dispatched,
+        "message": "Batch started. Use /batch/{batch_id} to check progress."
+    }
+
+
+@app.get("/batch/{batch_id}")
+def get_batch_status(batch_id: str, include_results: bool = True, db: Session = Depends(get_db)):
+
+    records = (
+        db.query(AnalysisResult)
+        .filter(AnalysisResult.batch_id == batch_id)
+        .order_by(AnalysisResult.id)
+        .all()
+    )
+    if not records:
+        raise HTTPException(status_code=404, detail="Batch not found")
+
+    # Attached jobs report the state of the job doing the work
+    leader_ids = {r.duplicate_of for r in records if r.duplicate_of is not None}
+    leaders = {
+        r.id: r for r in
+        db.query(AnalysisResult).filter(AnalysisResult.id.in_(leader_ids)).all()
+    } if leader_ids else {}
+
+    documents = []
+    counts = {}
+    for record in records:
+        source = leaders.get(record.duplicate_of, record)
+        counts[source.status] = counts.get(source.status, 0) + 1
+        document = {
+            "job_id": record.id,
+            "file_name": record.file_name,
+            "status": source.status,
+        }
+        if include_results:
+            document["result"] = json.loads(source.result_json) if source.result_json else None
+        documents.append(document)
+
+    finished = counts.get("COMPLETED", 0) + counts.get("FAILED", 0)
+    if finished < len(records):
+        status = "PROCESSING"
+    elif counts.get("FAILED"):
+        status = "COMPLETED_WITH_ERRORS"
+    else:
+        status = "COMPLETED"
+
+    return {
+        "batch_id": batch_id,
+        "status": status,
+        "total": len(records),
+        "counts": counts,
+        "documents": documents,
+    }
+
+
 @app.get("/status/{job_id}")
-def get_status(job_id: int):
+def get_status(job_id: int, db: Session = Depends(get_db)):
 
-    db = SessionLocal()
-    record = db.query(AnalysisResult).filter(AnalysisResult.id == job_id).first()
-    db.close()
+    record = db.get(AnalysisResult, job_id)
+    # Attached jobs report the state of the job doing the work
+    source = record
+    if record is not None and record.duplicate_of is not None:
+        source = db.get(AnalysisResult, record.duplicate_of) or record
 
     if not record:
         return {"error": "Job not found"}
 
     return {
         "job_id": record.id,
-        "status": record.status,
-        "result": json.loads(record.result_json) if record.result_json else None
+        "status": source.status,
+        "from_cache": bool(source.from_cache),
+        "result": json.loads(source.result_json) if source.result_json else None
     }
+
+
+# Seconds between keep-alive comments; each one also re-checks the job in
+# the database in case an event was lost
+STREAM_HEARTBEAT_SECONDS = 15
+
+
+def _job_snapshot(job_id: int):
+    db = SessionLocal()
+    try:
+        record = db.get(AnalysisResult, job_id)
+        if record is None:
+            return None
+        return {
+            "job_id": job_id,
+            "status": record.status,
+            "from_cache": bool(record.from_cache),
+            "result": json.loads(record.result_json) if record.result_json else None,
+        }
+    finally:
+        db.close()
+
+
+def _stream_source(job_id: int):
+    # Id of the job doing the work (attached jobs follow it), or None.
+    # Uses its own short session: a request-scoped one may stay open for
+    # the whole life of the stream.
+    db = SessionLocal()
+    try:
+        record = db.get(AnalysisResult, job_id)
+        if record is None:
+            return None
+        return record.duplicate_of or record.id
+    finally:
+        db.close()
+
+
+def _sse(event: dict) -> str:
+    return f"event: status\ndata: {json.dumps(event)}\n\n"
+
+
+@app.get("/status/{job_id}/stream")
+async def stream_status(job_id: int):
+    """
+    Server-Sent Events stream of a job's state transitions and progress
+    stages, ending when the job completes or fails
+    """
+    source_id = await asyncio.to_thread(_stream_source, job_id)
+    if source_id is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def events():
+        async with subscription(source_id) as queue:
+            snapshot = await asyncio.to_thread(_job_snapshot, source_id)
+            if snapshot["status"] == "PROCESSING":
+                latest = await last_event(source_id)
+                snapshot["stage"] = latest.get("stage") if latest else None
+            yield _sse({**snapshot, "job_id": job_id})
+            if snapshot["status"] in TERMINAL_STATUSES:
+                return
+
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), STREAM_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    snapshot = await asyncio.to_thread(_job_snapshot, source_id)
+                    if snapshot["status"] in TERMINAL_STATUSES:
+                        yield _sse({**snapshot, "job_id": job_id})
+                        return
+                    yield ": keep-alive\n\n"
+                    continue
+
+                if event["status"] in TERMINAL_STATUSES:
+                    # Final event carries the stored result
+                    final = await asyncio.to_thread(_job_snapshot, source_id)
+                    yield _sse({**final, "job_id": job_id})
+                    return
+                yield _sse({**event, "job_id": job_id})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/index/search")
+def search_index(q: str, file_name: str = None, limit: int = 10):
+    """
+    Search every previously processed document, e.g.
+    /index/search?q=debt levels&file_name=TSLA. Answers from the stored
+    index; no PDF is re-read and no crew is run.
+    """
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="Query cannot be empty")
+    limit = max(1, min(limit, 50))
+    return {
+        "query": q,
+        "documents": document_index.search(q.strip(), file_name, limit),
+    }
+
+
+@app.get("/index/stats")
+def get_index_stats():
+    return document_index.stats()
+
+
+@app.get("/cache/stats")
+def get_cache_stats():
+    return {"extraction_cache": extraction_cache.stats()}
+
+
+@app.get("/queues")
+def get_queues(db: Session = Depends(get_db)):
+    """
+    Queue depth and wait times per lane (interactive, bulk), and bulk jobs
+    per client
+    """
+    return queue_stats(db)
+
+
+@app.get("/metrics")
+def get_metrics(db: Session = Depends(get_db)):
+    """
+    Job counts, token and cache counters, and per-stage latency summaries
+    in the Prometheus text format
+    """
+    return PlainTextResponse(render_prometheus(db), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
@@ -0,0 +1,243 @@
+## Deterministic extraction of financial line items from document text
+import re
+
+
+# Canonical line item -> label pattern, matched at the start of a line.
+# Order matters: more specific labels come before the generic ones they
+# would otherwise be shadowed by.
+LINE_ITEMS = {
+    "revenue": r"total\s+revenues?|total\s+net\s+(?:sales|revenues?)|net\s+(?:sales|revenues?)|revenues?",
+    "gross_profit": r"(?:total\s+)?gross\s+(?:profit|margin)",
+    "operating_income": r"(?:total\s+)?(?:income|\(loss\)\s+income|income\s+\(loss\))\s+from\s+operations|operating\s+(?:income|profit)(?:\s+\(loss\))?",
+    "net_income": r"net\s+(?:income|earnings|\(loss\)\s+income|income\s+\(loss\))(?:\s+attributable\s+to\s+common\s+stockholders)?|net\s+loss",
+    "operating_cash_flow": r"net\s+cash\s+(?:provided\s+by|from|\(used\s+in\)\s+provided\s+by|provided\s+by\s+\(used\s+in\))\s+operating\s+activities|cash\s+flows?\s+from\s+operating\s+activities|operating\s+cash\s+flows?",
+    "capital_expenditures": r"capital\s+expenditures|purchases\s+of\s+property(?:,)?\s+(?:plant\s+)?and\s+equipment",
+    "free_cash_flow": r"free\s+cash\s+flows?",
+    "cash": r"(?:total\s+)?cash(?:,)?\s+(?:and\s+)?cash\s+equivalents(?:\s+and\s+(?:short-term\s+)?investments)?",
+    "total_current_assets": r"total\s+current\s+assets",
+    "total_assets": r"total\s+assets",
+    "total_current_liabilities": r"total\s+current\s+liabilities",
+    "total_liabilities": r"total\s+liabilities",
+    "total_debt": r"total\s+(?:debt|borrowings)|long-term\s+debt(?:\s+and\s+finance\s+leases)?(?:,\s+net\s+of\s+current\s+portion)?",
+    "total_equity": r"total\s+(?:stockholders|shareholders)[’']?\s+equity|total\s+equity",
+}
+
+LINE_ITEM_LABELS = {
+    "revenue": "Revenue",
+    "gross_profit": "Gross profit",
+    "operating_income": "Operating income",
+    "net_income": "Net income",
+    "operating_cash_flow": "Operating cash flow",
+    "capital_expenditures": "Capital expenditures",
+    "free_cash_flow": "Free cash flow",
+    "cash": "Cash and cash equivalents",
+    "total_current_assets": "Total current assets",
+    "total_assets": "Total assets",
+    "total_current_liabilities": "Total current liabilities",
+    "total_liabilities": "Total liabilities",
+    "total_debt": "Total debt",
+    "total_equity": "Total equity",
+}
+
+# Per-share rows ("Net income per diluted share 0.52") are not the item
+_PER_SHARE = r"(?!\s+per\s+(?:(?:basic|diluted|common)\s+)?share)"
+
+_LINE_ITEM_PATTERNS = [
+    (name, re.compile(rf"^\s*(?:{pattern})\b{_PER_SHARE}[\s:$]*(?=[\s\d($-]|$)", re.IGNORECASE))
+    for name, pattern in LINE_ITEMS.items()
+]
+
+# "Net loss 1,234" reports a negative figure without a sign; "Net income
+# (loss)" rows carry the sign in the figure
+_LOSS_LABEL = re.compile(r"(?<!\()\bloss\b(?!\))", re.IGNORECASE)
+
+# Figures such as 1,234  (1,234)  -56.7  $ 12,345 ; percentages are skipped.
+# The lookaheads also stop a match from ending inside a longer figure,
+# e.g. "16" out of "16.3%".
+_NOT_PERCENT = r"(?![\d.,]*\)?\s?%)"
+_NUMBER = re.compile(
+    rf"(?<![\w.])\(?-?\$?\s?\d{{1,3}}(?:,\d{{3}})+(?:\.\d+)?\)?{_NOT_PERCENT}(?!\.\d)"
+    rf"|(?<![\w.,])\(?-?\$?\s?\d+(?:\.\d+)?\)?{_NOT_PERCENT}(?![\d,]|\.\d)"
+)
+# A row of percentages (margins, growth rates) is never a currency line item
+_PERCENT_FIGURE = re.compile(r"\d\)?\s?%")
+
+_UNIT = re.compile(r"\bin\s+(thousands|millions|billions)\b", re.IGNORECASE)
+UNIT_SCALE = {"thousands": 1e3, "millions": 1e6, "billions": 1e9}
+
+# Q2-2025, Q2 2025, Q2'25, FY2024, FY 24, or a bare year
+_PERIOD = re.compile(
+    r"\b(?:(Q[1-4])[\s\-']*(?:FY)?\s?'?(\d{4}|\d{2})|FY\s?'?(\d{4}|\d{2})|((?:19|20)\d{2}))\b",
+    re.IGNORECASE,
+)
+
+
+# June 30, 2025 / Dec. 31, 2024 (balance sheet columns)
+_DATE = re.compile(
+    r"\b(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\.?\s+(\d{1,2}),?\s+((?:19|20)\d{2})\b",
+    re.IGNORECASE,
+)
+_MONTHS = ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"]
+
+# A figure row may carry a short note after its label, e.g. "(GAAP)";
+# more words than this means the line is prose
+MAX_WORDS_AFTER_LABEL = 2
+_WORD = re.compile(r"[A-Za-z]{2,}")
+
+
+def _parse_date(match) -> tuple:
+    month, day, year = match.groups()
+    month_number = _MONTHS.index(month[:3].lower()) + 1
+    label = f"{year}-{month_number:02d}-{int(day):02d}"
+    # Sorts after quarters of the same year ending no later than it
+    return label, (int(year), (month_number + 2) // 3, int(day))
+
+
+def _parse_period(match) -> tuple:
+    """
+    (label, sort key) for a period match; the key orders periods in time
+    """
+    quarter, quarter_year, fiscal_year, year = match.groups()
+    raw_year = quarter_year or fiscal_year or year
+    year_value = int(raw_year) + (2000 if len(raw_year) == 2 else 0)
+    if quarter:
+        label = f"{quarter.upper()}-{year_value}"
+        return label, (year_value, int(quarter[1]), 0)
+    label = f"FY{year_value}" if fiscal_year else str(year_value)
+    return label, (year_value, 5, 0)
+
+
+def _parse_number(token: str):
+    negative = token.strip().startswith("(") or "-" in token
+    digits = re.sub(r"[^\d.]", "", token)
+    if not digits or digits == ".":
+        return None
+    value = float(digits)
+    return -value if negative else value
+
+
+def _period_header(line: str):
+    """
+    Period labels if the line is a column header (two or more periods and
+    nothing that looks like a figure), else None
+    """
+    dates = [(m.start(), _parse_date(m)) for m in _DATE.finditer(line)]
+    without_dates = _DATE.sub(lambda m: " " * len(m.group()), line)
+    others = [(m.start(), _parse_period(m)) for m in _PERIOD.finditer(without_dates)]
+
+    periods = [period for _, period in sorted(dates + others)]
+    if len(periods) < 2:
+        return None
+    if re.search(r"\d", _PERIOD.sub(" ", without_dates)):
+        return None
+    return periods
+
+
+def extract_line_items(text: str) -> dict:
+    """
+    Find labeled line items and their figures per period.
+
+    Returns {item: {"label", "unit", "values": {period: value}}}, with
+    values in units (already multiplied by the stated scale) and periods
+    in chronological order. For each item the occurrence with the most
+    periods wins, so a full statement beats a passing mention.
+    """
+    items = {}
+    scale, unit_name = 1.0, None
+    periods = []
+
+    for line in text.splitlines():
+        unit_match = _UNIT.search(line)
+        if unit_match:
+            # A unit declaration starts a new table; its columns follow
+            unit_name = unit_match.group(1).lower()
+            scale = UNIT_SCALE[unit_name]
+            periods = []
+
+        header = _period_header(line)
+        if header:
+            periods = header
+            continue
+
+        for name, pattern in _LINE_ITEM_PATTERNS:
+            label_match = pattern.match(line)
+            if not label_match:
+                continue
+
+            remainder = line[label_match.end():]
+            if len(_WORD.findall(remainder)) > MAX_WORDS_AFTER_LABEL:
+                break
+            if _PERCENT_FIGURE.search(remainder):
+                break
+
+            values = [
+                v for v in (_parse_number(t) for t in _NUMBER.findall(remainder))
+                if v is not None
+            ]
+            if not values or not periods:
+                break
+            if _LOSS_LABEL.search(label_match.group()):
+                values = [-abs(v) for v in values]
+
+            # Columns are right-aligned: footnote markers and row numbers
+            # end up on the left
+            count = min(len(values), len(periods))
+            columns = periods[-count:]
+            row = {
+                label: value * scale
+                for (label, _), value in zip(columns, values[-count:])
+            }
+            ordered = dict(sorted(row.items(), key=lambda kv: dict(columns)[kv[0]]))
+
+            if len(ordered) > len(items.get(name, {}).get("values", {})):
+                items[name] = {
+                    "label": LINE_ITEM_LABELS[name],
+                    "unit": unit_name,
+                    "values": ordered,
+                }
+            break
+
+    return items
+
+
+def _format_amount(value: float) -> str:
+    sign = "-" if value < 0 else ""
+    value = abs(value)
+    for threshold, suffix in ((1e9, "billion"), (1e6, "million"), (1e3, "thousand")):
+        if value >= threshold:
+            return f"{sign}${value / threshold:,.2f} {suffix}"
+    return f"{sign}${value:,.2f}"
+
+
+def _trend(values: dict):
+    if len(values) < 2:
+        return None
+    (previous_period, previous), (latest_period, latest) = list(values.items())[-2:]
+    if previous == 0:
+        return None
+    if previous < 0 and latest < 0:
+        # Outflows such as capital expenditures: compare magnitudes
+        previous, latest = -previous, -latest
+    change = (latest - previous) / abs(previous) * 100
+    direction = "increased" if change > 0 else "decreased" if change < 0 else "unchanged"
+    if direction == "unchanged":
+        return f"unchanged from {previous_period}"
+    return f"{direction} {abs(change):.1f}% from {previous_period} to {latest_period}"
+
+
+def to_key_financial_metrics(items: dict) -> list:
+    """
+    Line items in the `key_financial_metrics` shape of the analysis schema
+    """
+    metrics = []
+    for name in LINE_ITEMS:
+        item = items.get(name)
+        if item is None:
+            continue
+        latest_period, latest = list(item["values"].items())[-1]
+        metrics.append({
+            "metric": item["label"],
+            "value": f"{_format_amount(latest)} ({latest_period})",
+            "trend": _trend(item["values"]),
+        })
+    return metrics
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, LargeBinary, Float
 from datetime import datetime
 from database import Base
 
@@ -9,5 +9,95 @@ class AnalysisResult(Base):
     file_name = Column(String)
     query = Column(String)
     result_json = Column(Text)
-    status = Column(String, default="PENDING")
-    created_at = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    status = Column(String, default="PENDING", index=True)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    from_cache = Column(Boolean, default=False)
+    file_hash = Column(String, index=True)
+    request_key = Column(String, index=True)
+    # Set when this job was attached to an identical in-flight job
+    duplicate_of = Column(Integer, nullable=True)
+    # Shared by all jobs submitted together through /analyze/batch
+    batch_id = Column(String, nullable=True, index=True)
+    mode = Column(String, nullable=True)
+    # X-Client-Id header, or the caller's address
+    client_id = Column(String, nullable=True, index=True)
+    # "interactive" or "bulk" (see scheduler.py)
+    lane = Column(String, nullable=True, index=True)
+
+    ## Instrumentation (see job_metrics.py). Timestamps are UTC; queue
+    ## waits are the gaps between them.
+    upload_bytes = Column(Integer, nullable=True)
+    upload_seconds = Column(Float, nullable=True)
+    # Handed to Celery; bulk jobs may first wait for a slot after created_at
+    enqueued_at = Column(DateTime, nullable=True)
+    started_at = Column(DateTime, nullable=True)
+    extracted_at = Column(DateTime, nullable=True)
+    llm_started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True, index=True)
+    extraction_seconds = Column(Float, nullable=True)
+    llm_seconds = Column(Float, nullable=True)
+    persist_seconds = Column(Float, nullable=True)
+    pages = Column(Integer, nullable=True)
+    characters = Column(Integer, nullable=True)
+    extraction_cache_hit = Column(Boolean, nullable=True)
+    prompt_tokens = Column(Integer, nullable=True)
+    completion_tokens = Column(Integer, nullable=True)
+    llm_calls = Column(Integer, nullable=True)
+    llm_retries = Column(Integer, nullable=True)
+    # Re-prompts for fields that failed output validation
+    output_repairs = Column(Integer, nullable=True)
+    # Celery retries after a transient failure (see tasks.process_analysis)
+    task_retries = Column(Integer, nullable=True)
+
+
+## Completed stages of an in-flight job, so a retry resumes after them
+## (see checkpoints.py)
+class JobCheckpoint(Base):
+    __tablename__ = "job_checkpoints"
+
+    job_id = Column(Integer, primary_key=True)
+    stage = Column(String, primary_key=True)
+    payload_json = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class CachedResponse(Base):
+    __tablename__ = "response_cache"
+
+    key = Column(String, primary_key=True)
+    model = Column(String)
+    result_json = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_used_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+
+## Search index over processed documents (see document_index.py)
+class IndexedDocument(Base):
+    __tablename__ = "indexed_documents"
+
+    content_hash = Column(String, primary_key=True)
+    file_name = Column(String, index=True)
+    indexed_at = Column(DateTime, default=datetime.utcnow)
+    section_count = Column(Integer)
+    # extract_line_items() result, so figures are queryable without the PDF
+    line_items_json = Column(Text)
+
+
+class IndexedSection(Base):
+    __tablename__ = "indexed_sections"
+
+    id = Column(Integer, primary_key=True)
+    content_hash = Column(String, index=True)
+    position = Column(Integer)
+    text = Column(Text)
+    token_count = Column(Integer)
+    # float32 unit vector; NULL when no embedding model was available
+    embedding = Column(LargeBinary, nullable=True)
+
+
+class IndexPosting(Base):
+    __tablename__ = "index_postings"
+
+    term = Column(String, primary_key=True)
+    section_id = Column(Integer, primary_key=True, index=True)
+    frequency = Column(Integer)
\ No newline at end of file
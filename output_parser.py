@@ -0,0 +1,314 @@
+## Tolerant parsing of crew output into the task schemas
+import json
+import re
+from typing import Annotated, List, Literal, Optional
+
+from pydantic import BaseModel, BeforeValidator, ConfigDict, Field, ValidationError
+
+
+class OutputParseError(ValueError):
+    """
+    The crew output could not be turned into the task's schema. `errors`
+    maps each failing field to the validation message.
+    """
+
+    def __init__(self, message: str, errors: dict = None):
+        super().__init__(message)
+        self.errors = errors or {}
+
+
+## Schemas of the tasks' expected_output (see task.py)
+def _one_of(*choices):
+    # "high" / "STRONG BUY" -> "High" / "Strong Buy"
+    by_key = {" ".join(choice.lower().split()): choice for choice in choices}
+
+    def normalize(value):
+        if isinstance(value, str):
+            return by_key.get(" ".join(value.lower().replace("_", " ").split()), value)
+        return value
+    return normalize
+
+
+def _score(value):
+    # "85", "85%" or 85.0 -> 85; a 0-1 fraction is read as a percentage
+    if isinstance(value, str):
+        match = re.search(r"-?\d+(?:\.\d+)?", value)
+        if match is None:
+            return value
+        value = float(match.group())
+    if isinstance(value, float):
+        if 0 < value < 1:
+            value *= 100
+        return round(value)
+    return value
+
+
+def _as_list(value):
+    if isinstance(value, str):
+        return [value] if value.strip() else []
+    return value
+
+
+def _as_text(value):
+    # Figures the model left as numbers
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    return value
+
+
+RiskLevel = Annotated[
+    Literal["Low", "Medium", "High"],
+    BeforeValidator(_one_of("Low", "Medium", "High")),
+    Field(description='"Low" | "Medium" | "High"'),
+]
+Score = Annotated[int, BeforeValidator(_score), Field(ge=0, le=100, description="integer 0-100")]
+Text = Annotated[str, Field(description="string")]
+TextList = Annotated[list, BeforeValidator(_as_list), Field(description="list")]
+
+
+class OutputSchema(BaseModel):
+    # Fields the model added on its own are dropped
+    model_config = ConfigDict(extra="ignore")
+
+
+class KeyFinancialMetric(OutputSchema):
+    metric: str
+    value: Annotated[Optional[str], BeforeValidator(_as_text)] = None
+    trend: Annotated[Optional[str], BeforeValidator(_as_text)] = None
+
+
+MetricList = Annotated[
+    List[KeyFinancialMetric],
+    BeforeValidator(_as_list),
+    Field(description='[{"metric": string, "value": string | null, "trend": string | null}]'),
+]
+
+
+class NarrativeAnalysis(OutputSchema):
+    executive_summary: Text
+    risk_level: RiskLevel
+    risk_explanation: Text
+    investment_recommendation: Annotated[
+        Literal["Strong Buy", "Buy", "Hold", "Sell"],
+        BeforeValidator(_one_of("Strong Buy", "Buy", "Hold", "Sell")),
+        Field(description='"Strong Buy" | "Buy" | "Hold" | "Sell"'),
+    ]
+    confidence_score: Score
+
+
+class FinancialAnalysis(NarrativeAnalysis):
+    key_financial_metrics: MetricList
+
+
+class ChunkMetrics(OutputSchema):
+    key_financial_metrics: MetricList = []
+    notes: Annotated[str, BeforeValidator(lambda v: "" if v is None else v)] = ""
+
+
+class InvestmentAnalysis(OutputSchema):
+    investment_thesis: Text
+    financial_strengths: TextList
+    financial_weaknesses: TextList
+    valuation_observation: Text
+    investment_recommendation: Annotated[
+        Literal["Strong Buy", "Buy", "Hold", "Sell", "Strong Sell"],
+        BeforeValidator(_one_of("Strong Buy", "Buy", "Hold", "Sell", "Strong Sell")),
+        Field(description='"Strong Buy" | "Buy" | "Hold" | "Sell" | "Strong Sell"'),
+    ]
+    rationale: Text
+    confidence_score: Score
+
+
+class RiskAssessment(OutputSchema):
+    risk_level: RiskLevel
+    key_risk_factors: TextList
+    downside_scenarios: TextList
+    risk_mitigation_strategies: TextList
+    overall_risk_summary: Text
+
+
+class Verification(OutputSchema):
+    is_financial_document: Annotated[bool, Field(description="true | false")]
+    document_type: Text
+    confidence_score: Score
+    reasoning: Text
+
+
+## Locating and repairing the JSON object
+QUOTES = {'"': '"', "'": "'", "“": "”", "‘": "’"}
+BAREWORDS = {
+    "true": "true", "True": "true",
+    "false": "false", "False": "false",
+    "null": "null", "None": "null", "NaN": "null", "undefined": "null",
+}
+# Object candidates tried per output, in order of appearance
+MAX_CANDIDATES = 5
+
+
+def _object_spans(text: str):
+    """
+    Start and end of each top-level `{...}` in `text`; an object cut off
+    by the output limit runs to the end
+    """
+    start = text.find("{")
+    while start != -1:
+        depth = 0
+        in_string = False
+        escaped = False
+        end = len(text)
+        for i in range(start, len(text)):
+            ch = text[i]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif ch == "\\":
+                    escaped = True
+                elif ch == '"':
+                    in_string = False
+            elif ch == '"':
+                in_string = True
+            elif ch in "{[":
+                depth += 1
+            elif ch in "}]":
+                depth -= 1
+                if depth == 0:
+                    end = i + 1
+                    break
+        yield start, end
+        start = text.find("{", end)
+
+
+def _drop_trailing_comma(out: list):
+    while out and out[-1].isspace():
+        out.pop()
+    if out and out[-1] == ",":
+        out.pop()
+
+
+def repair_json(text: str) -> str:
+    """
+    Fix what small models commonly get wrong in JSON: comments, trailing
+    commas, single or curly quotes, unquoted keys, Python literals, raw
+    newlines in strings, and brackets left open by a truncated answer
+    """
+    out = []
+    stack = []
+    i = 0
+    n = len(text)
+    while i < n:
+        ch = text[i]
+
+        if ch in QUOTES:
+            closer = QUOTES[ch]
+            chars = []
+            i += 1
+            while i < n and text[i] != closer and not (closer == '"' and text[i] == "”"):
+                if text[i] == "\\" and i + 1 < n:
+                    nxt = text[i + 1]
+                    chars.append(nxt if nxt == "'" else "\\" + nxt)
+                    i += 2
+                    continue
+                chars.append({'"': '\\"', "\n": "\\n", "\r": "\\r", "\t": "\\t"}.get(text[i], text[i]))
+                i += 1
+            out.append('"' + "".join(chars) + '"')
+            i += 1
+            continue
+
+        if ch == "/" and text[i + 1:i + 2] == "/":
+            newline = text.find("\n", i)
+            i = n if newline == -1 else newline
+            continue
+        if ch == "/" and text[i + 1:i + 2] == "*":
+            close = text.find("*/", i + 2)
+            i = n if close == -1 else close + 2
+            continue
+
+        if ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+            out.append(ch)
+        elif ch in "}]":
+            _drop_trailing_comma(out)
+            if stack:
+                stack.pop()
+            out.append(ch)
+        elif ch.isdigit() or ch in "-+.":
+            match = re.match(r"[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?", text[i:])
+            if match is None:
+                i += 1
+                continue
+            number = match.group().lstrip("+")
+            # JSON wants a digit on both sides of the point
+            number = re.sub(r"^(-?)\.", r"\g<1>0.", number)
+            out.append(re.sub(r"\.(?!\d)", "", number))
+            i += len(match.group())
+            continue
+        elif ch.isalpha() or ch == "_":
+            match = re.match(r"[A-Za-z_][\w\-]*", text[i:])
+            word = match.group()
+            i += len(word)
+            is_key = re.match(r"\s*:", text[i:]) is not None
+            out.append(json.dumps(word) if is_key else BAREWORDS.get(word, json.dumps(word)))
+            continue
+        else:
+            out.append(ch)
+        i += 1
+
+    _drop_trailing_comma(out)
+    # A truncated answer may end mid-pair; close what is open
+    if out and out[-1] == ":":
+        out.append("null")
+    out.extend(reversed(stack))
+    return "".join(out)
+
+
+def parse_json_object(raw: str) -> dict:
+    """
+    The JSON object in a crew answer, tolerating surrounding prose, code
+    fences and the defects `repair_json` fixes
+    """
+    try:
+        data = json.loads(raw)
+        if isinstance(data, dict):
+            return data
+    except ValueError:
+        pass
+
+    for count, (start, end) in enumerate(_object_spans(raw)):
+        if count == MAX_CANDIDATES:
+            break
+        candidate = raw[start:end]
+        for text in (candidate, repair_json(candidate)):
+            try:
+                data = json.loads(text)
+            except ValueError:
+                continue
+            if isinstance(data, dict):
+                return data
+
+    raise OutputParseError("No JSON object found in the output")
+
+
+def validate_output(data: dict, schema):
+    """
+    Returns (validated dict, {}) or (None, {field: message}) naming every
+    field that failed
+    """
+    try:
+        return schema.model_validate(data).model_dump(), {}
+    except ValidationError as error:
+        errors = {}
+        for item in error.errors():
+            field = str(item["loc"][0]) if item["loc"] else "output"
+            errors.setdefault(field, item["msg"])
+        return None, errors
+
+
+def field_schema(schema, fields) -> str:
+    """
+    The expected_output-style structure of just `fields`
+    """
+    lines = [
+        f'  "{name}": {schema.model_fields[name].description or "string"}'
+        for name in fields if name in schema.model_fields
+    ]
+    return "{\n" + ",\n".join(lines) + "\n}"
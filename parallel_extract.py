@@ -0,0 +1,188 @@
+## Parallel per-page PDF extraction over a process pool
+import os
+import math
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import resource_tracker, shared_memory
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from text_normalize import normalize_text
+
+
+PARALLEL_EXTRACTION = os.getenv("PARALLEL_EXTRACTION", "1") == "1"
+EXTRACTION_PROCESSES = int(os.getenv("EXTRACTION_PROCESSES", str(os.cpu_count() or 1)))
+# Below this a document is one range: splitting it costs more in PDF
+# reopens than it saves. It still runs in the pool, so worker threads
+# never parse under the GIL.
+PARALLEL_MIN_PAGES = int(os.getenv("PARALLEL_MIN_PAGES", "32"))
+# Page ranges per process; more than one evens out slow pages
+RANGES_PER_PROCESS = 2
+# Range size when only the first max_chars characters are wanted, so the
+# pool stops soon after the budget is filled
+BUDGET_RANGE_PAGES = int(os.getenv("BUDGET_RANGE_PAGES", "8"))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=EXTRACTION_PROCESSES)
+        return _pool
+
+
+def _discard_pool(pool):
+    # A pool whose process died rejects all further work; start afresh
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+
+def _create_block(size: int):
+    # The parent reads and unlinks the block; this process's resource
+    # tracker must not also claim it when the pool process exits
+    try:
+        return shared_memory.SharedMemory(create=True, size=size, track=False)
+    except TypeError:  # Python < 3.13
+        block = shared_memory.SharedMemory(create=True, size=size)
+        resource_tracker.unregister(block._name, "shared_memory")
+        return block
+
+
+def _extract_range(path: str, start: int, stop: int):
+    """
+    Runs in a pool process: extract pages [start, stop) and leave the
+    UTF-8 text in a shared memory block, so only its name and the page
+    lengths are pickled back
+    """
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    encoded = [
+        normalize_text(reader.pages[i].extract_text()).encode("utf-8")
+        for i in range(start, stop)
+    ]
+    lengths = [len(page) for page in encoded]
+
+    block = _create_block(max(sum(lengths), 1))
+    offset = 0
+    for page in encoded:
+        block.buf[offset:offset + len(page)] = page
+        offset += len(page)
+    name = block.name
+    block.close()
+    return name, lengths
+
+
+def _read_block(name: str, lengths: list) -> list:
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        data = bytes(block.buf[:sum(lengths)])
+    finally:
+        block.close()
+        block.unlink()
+
+    pages = []
+    offset = 0
+    for length in lengths:
+        pages.append(data[offset:offset + length].decode("utf-8"))
+        offset += length
+    return pages
+
+
+def page_count(path: str) -> int:
+    from pypdf import PdfReader
+    return len(PdfReader(path).pages)
+
+
+def can_run_parallel() -> bool:
+    # Daemonic processes (e.g. Celery prefork children) may not start
+    # children of their own; run the extraction worker with --pool=threads
+    # for the pool to be used
+    return (
+        PARALLEL_EXTRACTION
+        and EXTRACTION_PROCESSES > 1
+        and not multiprocessing.current_process().daemon
+    )
+
+
+def _collect(pool, future) -> list:
+    # Raises if the range failed; a broken pool is discarded first
+    try:
+        name, lengths = future.result()
+    except BrokenProcessPool:
+        _discard_pool(pool)
+        raise
+    return _read_block(name, lengths)
+
+
+def extract_pages_parallel(path: str, max_chars: int = None):
+    """
+    Normalized page texts in page order, extracted in page ranges across
+    the process pool (small documents as a single range). With
+    `max_chars`, ranges are handed out in order and no more are started
+    once the pages collected reach it, so only about that many characters
+    are parsed. Returns None when parallel
+    extraction does not apply or fails, so the caller falls back to
+    serial extraction.
+    """
+    if not can_run_parallel():
+        return None
+
+    try:
+        total = page_count(path)
+    except Exception:
+        return None
+    if total == 0:
+        return None
+
+    window = EXTRACTION_PROCESSES * RANGES_PER_PROCESS
+    size = math.ceil(total / window)
+    if max_chars is not None:
+        size = min(size, BUDGET_RANGE_PAGES)
+    if total < PARALLEL_MIN_PAGES:
+        size = total
+    ranges = deque((start, min(start + size, total)) for start in range(0, total, size))
+
+    pool = _get_pool()
+    in_flight = deque()
+
+    def submit():
+        start, stop = ranges.popleft()
+        in_flight.append(pool.submit(_extract_range, path, start, stop))
+
+    while ranges and len(in_flight) < window:
+        submit()
+
+    pages = []
+    chars = 0
+    failed = False
+    # Collect every started range, even after a failure or once the
+    # budget is filled, so no block is leaked
+    while in_flight:
+        future = in_flight.popleft()
+        done = failed or (max_chars is not None and chars >= max_chars)
+        if done and future.cancel():
+            continue
+        try:
+            block_pages = _collect(pool, future)
+        except Exception:
+            failed = True
+            continue
+        if done:
+            continue
+        pages.extend(block_pages)
+        chars += sum(len(page) + 1 for page in block_pages)
+        if ranges and (max_chars is None or chars < max_chars):
+            submit()
+
+    return None if failed else pages
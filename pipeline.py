@@ -0,0 +1,614 @@
+## Shared analysis pipeline used by the API and the Celery worker
+import os
+import json
+import random
+import asyncio
+import threading
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from crewai import Crew, Process
+from agents import llm
+from task import (
+    analyze_financial_document,
+    analyze_financial_narrative,
+    investment_analysis,
+    make_chunk_metrics_task,
+    make_reduce_analysis_task,
+    make_repair_task,
+    risk_assessment,
+    verification,
+)
+from tools import FinancialDocumentTool
+from metrics_extractor import extract_line_items, to_key_financial_metrics
+from analytics import analyze_line_items
+from ranking import head_within_budget, select_relevant_text, split_sections
+from budget import count_tokens, document_token_budget, model_limits, template_tokens
+from rate_limiter import rate_limiter
+from response_cache import make_cache_key, response_cache
+from output_parser import (
+    ChunkMetrics,
+    FinancialAnalysis,
+    InvestmentAnalysis,
+    NarrativeAnalysis,
+    OutputParseError,
+    RiskAssessment,
+    Verification,
+    field_schema,
+    parse_json_object,
+    validate_output,
+)
+
+
+# How much of the document is extracted as ranking candidates. Pages past
+# this are never parsed.
+CANDIDATE_CHARS = int(os.getenv("CANDIDATE_CHARS", "200000"))
+
+# Fewer extracted line items than this and the LLM reads the figures itself
+MIN_EXTRACTED_METRICS = int(os.getenv("MIN_EXTRACTED_METRICS", "2"))
+
+NO_FIGURES = "No figures could be extracted from the financial statements."
+
+# Chunk extractions running at once in map-reduce mode
+MAP_CONCURRENCY = int(os.getenv("MAP_CONCURRENCY", "3"))
+
+# Provider 429s that still get through the scheduler (e.g. other clients
+# on the same key) are retried after a jittered backoff
+RATE_LIMIT_RETRIES = int(os.getenv("RATE_LIMIT_RETRIES", "3"))
+RATE_LIMIT_BACKOFF_SECONDS = float(os.getenv("RATE_LIMIT_BACKOFF_SECONDS", "10"))
+
+# Re-prompts for the fields of an answer that still fail validation after
+# local repair; 0 fails the job instead
+OUTPUT_REPAIR_ATTEMPTS = int(os.getenv("OUTPUT_REPAIR_ATTEMPTS", "1"))
+
+
+class Progress:
+    """
+    Reports pipeline stages ("extracting", "LLM call 2/3", "merging") to
+    an optional callback, and counts what the job consumed (`stats`:
+    prompt/completion tokens, LLM retries, output repairs). With
+    `checkpoints` (see checkpoints.JobCheckpoints), crew stages completed
+    by an earlier attempt of the job are not run again.
+    """
+
+    def __init__(self, callback=None, checkpoints=None):
+        self.callback = callback
+        self.checkpoints = checkpoints
+        self.total_calls = 1
+        self.calls = 0
+        self.stats = {}
+
+    def count(self, **amounts):
+        for name, amount in amounts.items():
+            self.stats[name] = self.stats.get(name, 0) + (amount or 0)
+
+    def stage(self, name: str):
+        if self.callback is not None:
+            self.callback(name)
+
+    def expect_calls(self, total: int):
+        self.total_calls = total
+
+    def llm_call(self):
+        self.calls += 1
+        self.stage(f"LLM call {self.calls}/{self.total_calls}")
+
+
+class CrewPool:
+    """
+    Crews for the module-level tasks, built once per process and reused
+    across jobs instead of constructing a Crew per call.
+
+    A crew carries per-run state, so each one serves a single run at a
+    time: concurrent runs of the same task (threads pool, or several jobs
+    in flight) get their own copy of the task's template crew, and every
+    copy goes back to the idle list afterwards.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._templates = {}
+        self._idle = {}
+
+    def _template(self, task):
+        template = self._templates.get(id(task))
+        if template is None:
+            template = Crew(agents=[task.agent], tasks=[task], process=Process.sequential)
+            self._templates[id(task)] = template
+        return template
+
+    @contextmanager
+    def crew(self, task):
+        with self._lock:
+            idle = self._idle.setdefault(id(task), [])
+            crew = idle.pop() if idle else self._template(task).copy()
+        try:
+            yield crew
+        finally:
+            with self._lock:
+                self._idle[id(task)].append(crew)
+
+    def warm(self, tasks):
+        """
+        Build one ready crew per task ahead of the first job
+        """
+        for task in tasks:
+            with self.crew(task):
+                pass
+
+
+crew_pool = CrewPool()
+
+# Crews built when a worker process starts (see tasks.warm_up)
+WARM_TASKS = [
+    analyze_financial_document,
+    analyze_financial_narrative,
+    verification,
+    investment_analysis,
+    risk_assessment,
+]
+
+
+def _is_rate_limit_error(error: Exception) -> bool:
+    return "ratelimit" in type(error).__name__.lower() or "429" in str(error)
+
+
+# Provider exception names (litellm/openai) worth retrying the job for
+TRANSIENT_ERROR_NAMES = ("timeout", "connection", "serviceunavailable", "internalserver", "badgateway")
+
+
+def is_transient_error(error: Exception) -> bool:
+    """
+    Whether the job may succeed if retried later: rate limits that
+    outlasted kickoff_crew's retries, timeouts, dropped connections and
+    provider-side 5xx errors
+    """
+    if isinstance(error, (ConnectionError, TimeoutError)) or _is_rate_limit_error(error):
+        return True
+    name = type(error).__name__.lower()
+    return any(part in name for part in TRANSIENT_ERROR_NAMES)
+
+
+async def resumable(progress: Progress, stage: str, run):
+    """
+    `await run()`, unless an earlier attempt of the job checkpointed
+    `stage`; its result is checkpointed for the next attempt
+    """
+    checkpoints = progress.checkpoints if progress is not None else None
+    if checkpoints is None:
+        return await run()
+
+    done = checkpoints.get(stage)
+    if done is not None:
+        return done
+    result = await run()
+    checkpoints.put(stage, result)
+    return result
+
+
+async def gather_stages(*stages) -> list:
+    """
+    asyncio.gather that lets every stage finish, and so checkpoint itself,
+    before re-raising the first error. A retried job then reruns only the
+    stages that failed.
+    """
+    results = await asyncio.gather(*stages, return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return results
+
+
+def _token_counts(crew) -> tuple:
+    """
+    (prompt, completion) tokens counted by the crew's agents. crewai never
+    resets these between kickoffs and pooled crews serve many jobs, so a
+    job's usage is the difference across its own kickoff.
+    """
+    prompt = completion = 0
+    for agent in crew.agents:
+        process = getattr(agent, "_token_process", None)
+        if process is None:
+            continue
+        summary = process.get_summary()
+        prompt += summary.prompt_tokens or 0
+        completion += summary.completion_tokens or 0
+    return prompt, completion
+
+
+async def kickoff_crew(crew, inputs: dict, progress: Progress = None):
+    """
+    Run a crew once the shared rate limiter admits its estimated token
+    cost, retrying provider rate-limit errors with jittered backoff
+    """
+    estimated_tokens = sum(
+        template_tokens(task, inputs) + model_limits(llm.model)["output_tokens"]
+        for task in crew.tasks
+    )
+
+    # Failed attempts count too: the provider billed what they used
+    prompt_before, completion_before = _token_counts(crew)
+
+    for attempt in range(RATE_LIMIT_RETRIES + 1):
+        await rate_limiter.acquire(estimated_tokens)
+        if progress is not None and attempt == 0:
+            progress.llm_call()
+        try:
+            result = await crew.kickoff_async(inputs)
+        except Exception as error:
+            if not _is_rate_limit_error(error) or attempt == RATE_LIMIT_RETRIES:
+                raise
+            if progress is not None:
+                progress.count(llm_retries=1)
+            backoff = RATE_LIMIT_BACKOFF_SECONDS * (2 ** attempt)
+            await asyncio.sleep(backoff * random.uniform(0.5, 1.5))
+            continue
+
+        if progress is not None:
+            prompt_after, completion_after = _token_counts(crew)
+            progress.count(
+                prompt_tokens=prompt_after - prompt_before,
+                completion_tokens=completion_after - completion_before,
+            )
+        return result
+
+
+async def parse_output(raw: str, schema, task, query: str, progress: Progress = None) -> dict:
+    """
+    Turn a crew answer into `schema`: locate and repair the JSON locally,
+    then re-prompt `task`'s agent for only the fields that still fail,
+    up to OUTPUT_REPAIR_ATTEMPTS times. The re-prompt carries the answer,
+    not the document, so it costs a fraction of a rerun.
+
+    Raises OutputParseError when the fields cannot be fixed.
+    """
+    try:
+        data = parse_json_object(raw)
+    except OutputParseError:
+        data = {}
+
+    for attempt in range(OUTPUT_REPAIR_ATTEMPTS + 1):
+        parsed, errors = validate_output(data, schema)
+        if not errors:
+            return parsed
+        if attempt == OUTPUT_REPAIR_ATTEMPTS:
+            break
+
+        repair_task = make_repair_task(task.agent)
+        crew = Crew(agents=[repair_task.agent], tasks=[repair_task], process=Process.sequential)
+        if progress is not None:
+            progress.expect_calls(progress.total_calls + 1)
+            progress.count(output_repairs=1)
+        result = await kickoff_crew(crew, {
+            "query": query,
+            "previous_output": raw,
+            "field_errors": "\n".join(f"- {field}: {message}" for field, message in errors.items()),
+            "field_schema": field_schema(schema, errors),
+        }, progress)
+
+        try:
+            fixes = parse_json_object(result.raw)
+        except OutputParseError:
+            fixes = {}
+        data = {**data, **{field: fixes[field] for field in errors if field in fixes}}
+
+    raise OutputParseError(
+        f"Output does not match {schema.__name__}: {', '.join(errors)}", errors
+    )
+
+
+def extract_figures(document_text: str):
+    """
+    Key financial metrics read straight from the statement tables, and the
+    ratios and rule-based risk computed from them.
+
+    Returns (metrics, analytics), or ([], None) when too few line items
+    were found to skip the LLM for them.
+    """
+    items = extract_line_items(document_text)
+    metrics = to_key_financial_metrics(items)
+    if len(metrics) < MIN_EXTRACTED_METRICS:
+        return [], None
+    return metrics, analyze_line_items(items)
+
+
+def _analysis_task(metrics: list):
+    return analyze_financial_narrative if metrics else analyze_financial_document
+
+
+def _analysis_schema(metrics: list):
+    return NarrativeAnalysis if metrics else FinancialAnalysis
+
+
+def _ratios_input(analytics: dict = None) -> str:
+    return json.dumps(analytics, indent=1) if analytics else NO_FIGURES
+
+
+def _analysis_inputs(query: str, document_text: str, metrics: list, analytics: dict = None) -> dict:
+    inputs = {
+        "query": query,
+        "document_text": document_text,
+        "financial_ratios": _ratios_input(analytics),
+    }
+    if metrics:
+        inputs["extracted_metrics"] = json.dumps(metrics, indent=1)
+    return inputs
+
+
+def _figures_key(inputs: dict) -> str:
+    # Extracted figures are merged into the result, so they are part of
+    # the cache key
+    if "extracted_metrics" not in inputs:
+        return ""
+    return inputs["extracted_metrics"] + inputs["financial_ratios"]
+
+
+def _with_metrics(narrative: dict, metrics: list, analytics: dict = None) -> dict:
+    # Same field order as the full analysis schema
+    result = {
+        "executive_summary": narrative.get("executive_summary"),
+        "key_financial_metrics": metrics,
+        **{k: v for k, v in narrative.items() if k != "executive_summary"},
+    }
+    if analytics:
+        result["quantitative_assessment"] = analytics
+    return result
+
+
+def prepare_document(file_path: str, query: str, content_hash: str = None, stats: dict = None):
+    """
+    Extract the document, pull the tabular figures out of it, and keep the
+    sections most relevant to the query, filling whatever the model's
+    token limit leaves after the prompt and the figures.
+
+    `stats`, if given, receives the extraction counters (pages,
+    characters, extraction_cache_hits).
+
+    Returns (document_text, metrics, analytics).
+    """
+    tool = FinancialDocumentTool()
+    document_text = tool.read_with_budget(file_path, CANDIDATE_CHARS, content_hash, stats)
+    metrics, analytics = extract_figures(document_text)
+
+    inputs = _analysis_inputs(query, "", metrics, analytics)
+    token_budget = document_token_budget(_analysis_task(metrics), query, llm.model, inputs)
+    document_text = select_relevant_text(document_text, query, token_budget, measure=count_tokens)
+    return document_text, metrics, analytics
+
+
+def run_analysis(query: str, document_text: str, progress: Progress = None,
+                 metrics: list = None, analytics: dict = None):
+    return asyncio.run(run_analysis_async(query, document_text, progress, metrics, analytics))
+
+
+async def run_analysis_async(query: str, document_text: str, progress: Progress = None,
+                             metrics: list = None, analytics: dict = None):
+    """
+    Run the analysis crew, answering from the response cache when the
+    same query, document, task and model were seen before. With extracted
+    `metrics` the LLM only writes the narrative fields and the metrics
+    and `analytics` are filled in as computed.
+
+    Returns the parsed JSON result and whether it came from the cache.
+    """
+    metrics = metrics or []
+    task = _analysis_task(metrics)
+    inputs = _analysis_inputs(query, document_text, metrics, analytics)
+
+    cache_key = make_cache_key(query, document_text, task, llm.model, _figures_key(inputs))
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return cached, True
+
+    async def analyze():
+        with crew_pool.crew(task) as crew:
+            result = await kickoff_crew(crew, inputs, progress)
+        return await parse_output(result.raw, _analysis_schema(metrics), task, query, progress)
+
+    parsed = await resumable(progress, "analysis", analyze)
+    if metrics:
+        parsed = _with_metrics(parsed, metrics, analytics)
+    response_cache.put(cache_key, llm.model, parsed)
+    return parsed, False
+
+
+def split_into_chunks(text: str, token_budget: int) -> list:
+    """
+    Group consecutive sections into chunks of at most `token_budget` tokens
+    """
+    chunks = []
+    current = []
+    used = 0
+    for section in split_sections(text):
+        cost = count_tokens(section)
+        if cost > token_budget:
+            section = head_within_budget(section, token_budget, count_tokens)
+            cost = token_budget
+        if current and used + cost > token_budget:
+            chunks.append("".join(current))
+            current = []
+            used = 0
+        current.append(section)
+        used += cost
+
+    if current:
+        chunks.append("".join(current))
+    return chunks
+
+
+def merge_metrics(partials: list) -> list:
+    """
+    Reduce the per-chunk metric lists into one list, one entry per metric
+    name, preferring entries that carry a value and a trend
+    """
+    merged = {}
+    for partial in partials:
+        for item in partial.get("key_financial_metrics") or []:
+            if not isinstance(item, dict) or not item.get("metric"):
+                continue
+            name = " ".join(str(item["metric"]).lower().split())
+            entry = merged.setdefault(name, {
+                "metric": item["metric"],
+                "value": None,
+                "trend": None,
+            })
+            if entry["value"] is None and item.get("value") is not None:
+                entry["value"] = item["value"]
+            if entry["trend"] is None and item.get("trend") is not None:
+                entry["trend"] = item["trend"]
+
+    return list(merged.values())
+
+
+async def _extract_chunk_metrics(query: str, chunk: str, semaphore, progress: Progress) -> dict:
+    task = make_chunk_metrics_task()
+    crew = Crew(agents=[task.agent], tasks=[task], process=Process.sequential)
+    # Repair re-prompts are LLM calls too, so they stay under the semaphore
+    async with semaphore:
+        result = await kickoff_crew(crew, {"query": query, "document_text": chunk}, progress)
+        try:
+            return await parse_output(result.raw, ChunkMetrics, task, query, progress)
+        except OutputParseError:
+            # One unreadable chunk shouldn't sink the whole filing
+            return {"key_financial_metrics": [], "notes": ""}
+
+
+async def _resumable_chunk(query: str, index: int, chunk: str, semaphore, progress: Progress) -> dict:
+    # Chunking is deterministic for a given document and model, so a
+    # chunk's position identifies it across attempts
+    return await resumable(
+        progress, f"chunk:{index}",
+        lambda: _extract_chunk_metrics(query, chunk, semaphore, progress),
+    )
+
+
+def run_map_reduce_analysis(query: str, file_path: str, content_hash: str = None,
+                            progress: Progress = None):
+    return asyncio.run(run_map_reduce_analysis_async(query, file_path, content_hash, progress))
+
+
+async def run_map_reduce_analysis_async(query: str, file_path: str, content_hash: str = None,
+                                        progress: Progress = None):
+    """
+    Analyze the full document: extract metrics from budget-sized chunks
+    concurrently (at most MAP_CONCURRENCY at a time), merge them, and
+    write the final answer from the merged metrics.
+
+    Returns the parsed JSON result and whether it came from the cache.
+    """
+    document_text = FinancialDocumentTool()._run(file_path, content_hash)
+
+    reduce_task = make_reduce_analysis_task()
+    cache_key = make_cache_key(query, document_text, reduce_task, llm.model)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return cached, True
+
+    # Figures read from the statement tables take precedence over the
+    # same metric as the LLM reported it from a chunk
+    extracted_metrics, analytics = extract_figures(document_text)
+    extracted = {"key_financial_metrics": extracted_metrics}
+
+    chunk_budget = document_token_budget(make_chunk_metrics_task(), query, llm.model)
+    chunks = split_into_chunks(document_text, chunk_budget)
+
+    progress = progress or Progress()
+    progress.expect_calls(len(chunks) + 1)
+
+    semaphore = asyncio.Semaphore(MAP_CONCURRENCY)
+    partials = await gather_stages(*[
+        _resumable_chunk(query, index, chunk, semaphore, progress)
+        for index, chunk in enumerate(chunks)
+    ])
+
+    progress.stage("merging")
+    metrics = merge_metrics([extracted, *partials])
+    notes = [p.get("notes") for p in partials if p.get("notes")]
+
+    async def reduce():
+        crew = Crew(agents=[reduce_task.agent], tasks=[reduce_task], process=Process.sequential)
+        result = await kickoff_crew(crew, {
+            "query": query,
+            "partial_metrics": json.dumps(metrics, indent=1),
+            "chunk_notes": "\n".join(f"- {note}" for note in notes),
+            "financial_ratios": _ratios_input(analytics),
+        }, progress)
+        return await parse_output(result.raw, FinancialAnalysis, reduce_task, query, progress)
+
+    parsed = await resumable(progress, "reduce", reduce)
+    # The merged list is authoritative; the reduce step only writes the
+    # narrative fields around it
+    parsed["key_financial_metrics"] = metrics
+    if analytics:
+        parsed["quantitative_assessment"] = analytics
+
+    response_cache.put(cache_key, llm.model, parsed)
+    return parsed, False
+
+
+async def _run_task(task, schema, stage: str, inputs: dict, progress: Progress = None) -> dict:
+    async def run():
+        with crew_pool.crew(task) as crew:
+            result = await kickoff_crew(crew, inputs, progress)
+        return await parse_output(result.raw, schema, task, inputs["query"], progress)
+
+    return await resumable(progress, stage, run)
+
+
+def run_full_analysis(query: str, document_text: str, progress: Progress = None,
+                      metrics: list = None, analytics: dict = None):
+    return asyncio.run(
+        run_full_analysis_async(query, document_text, progress, metrics, analytics)
+    )
+
+
+async def run_full_analysis_async(query: str, document_text: str, progress: Progress = None,
+                                  metrics: list = None, analytics: dict = None):
+    """
+    Verify the document, then run the analysis, investment and risk tasks
+    concurrently and combine them into one record. Each task has its own
+    agent, so they can share nothing but the rate limiter. Non-financial
+    documents stop after verification.
+
+    Returns the combined result and whether it came from the cache.
+    """
+    metrics = metrics or []
+    analysis_task = _analysis_task(metrics)
+    inputs = _analysis_inputs(query, document_text, metrics, analytics)
+
+    tasks = [verification, analysis_task, investment_analysis, risk_assessment]
+    cache_key = make_cache_key(query, document_text, tasks, llm.model, _figures_key(inputs))
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return cached, True
+
+    progress = progress or Progress()
+    progress.expect_calls(len(tasks))
+
+    verdict = await _run_task(verification, Verification, "verification", inputs, progress)
+    if not verdict.get("is_financial_document", False):
+        combined = {
+            "executive_summary": "The document was not recognized as a financial document.",
+            "key_financial_metrics": [],
+            "verification": verdict,
+        }
+    else:
+        analysis, investment, risk = await gather_stages(
+            _run_task(analysis_task, _analysis_schema(metrics), "analysis", inputs, progress),
+            _run_task(investment_analysis, InvestmentAnalysis, "investment", inputs, progress),
+            _run_task(risk_assessment, RiskAssessment, "risk", inputs, progress),
+        )
+        progress.stage("merging")
+        if metrics:
+            analysis = _with_metrics(analysis, metrics, analytics)
+        combined = {
+            **analysis,
+            "verification": verdict,
+            "investment_analysis": investment,
+            "risk_assessment": risk,
+        }
+
+    response_cache.put(cache_key, llm.model, combined)
+    return combined, False
@@ -0,0 +1,143 @@
+## Relevance-ranked chunk selection for the LLM context
+import re
+
+import numpy as np
+
+
+# Metrics requested by analyze_financial_document, always part of the query
+METRIC_TERMS = [
+    "revenue", "revenues", "sales", "net", "income", "earnings", "profit",
+    "debt", "borrowings", "liabilities", "cash", "flow", "flows", "operating",
+]
+
+STOPWORDS = {
+    "the", "and", "for", "this", "that", "with", "from", "what", "how", "are",
+    "was", "were", "its", "their", "about", "into", "document", "analyze",
+    "analysis", "financial", "please", "give", "show", "tell", "company",
+}
+
+SECTION_CHARS = 800
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Statement tables are dense in figures; a small boost keeps them ahead of
+# prose that only mentions the metric names
+NUMERIC_WEIGHT = 2.0
+
+_TOKEN = re.compile(r"[a-z][a-z0-9]+")
+_DIGIT = re.compile(r"\d")
+
+
+def tokenize(text: str) -> list:
+    return _TOKEN.findall(text.lower())
+
+
+def _is_heading(line: str) -> bool:
+    stripped = line.strip()
+    if not stripped or len(stripped) > 80:
+        return False
+    letters = [c for c in stripped if c.isalpha()]
+    return len(letters) >= 4 and all(c.isupper() for c in letters)
+
+
+def split_sections(text: str, section_chars: int = SECTION_CHARS) -> list:
+    """
+    Split text into chunks of roughly `section_chars`, preferring to break
+    at all-caps headings so statements stay together
+    """
+    sections = []
+    current = []
+    size = 0
+    for line in text.splitlines(keepends=True):
+        at_heading = _is_heading(line) and size >= section_chars // 3
+        if current and (at_heading or size + len(line) > section_chars):
+            sections.append("".join(current))
+            current = []
+            size = 0
+        current.append(line)
+        size += len(line)
+
+    if current:
+        sections.append("".join(current))
+    return sections
+
+
+def query_terms(query: str) -> list:
+    terms = [t for t in tokenize(query) if t not in STOPWORDS]
+    return list(dict.fromkeys(terms + METRIC_TERMS))
+
+
+def score_sections(sections: list, terms: list) -> np.ndarray:
+    """
+    BM25 score of every section against `terms`, computed as one
+    sections x terms matrix
+    """
+    term_index = {term: i for i, term in enumerate(terms)}
+    tf = np.zeros((len(sections), len(terms)), dtype=np.float32)
+    lengths = np.empty(len(sections), dtype=np.float32)
+    numeric = np.empty(len(sections), dtype=np.float32)
+
+    for row, section in enumerate(sections):
+        tokens = tokenize(section)
+        lengths[row] = len(tokens)
+        numeric[row] = len(_DIGIT.findall(section)) / max(len(section), 1)
+        columns = [term_index[t] for t in tokens if t in term_index]
+        if columns:
+            np.add.at(tf[row], columns, 1.0)
+
+    doc_freq = np.count_nonzero(tf, axis=0)
+    n = len(sections)
+    idf = np.log1p((n - doc_freq + 0.5) / (doc_freq + 0.5))
+
+    avg_length = max(float(lengths.mean()), 1.0)
+    norm = BM25_K1 * (1.0 - BM25_B + BM25_B * lengths / avg_length)
+    bm25 = (tf * (BM25_K1 + 1.0)) / (tf + norm[:, None])
+    return bm25 @ idf + NUMERIC_WEIGHT * numeric
+
+
+def pack_sections(sections: list, scores: np.ndarray, budget: int, measure=len) -> str:
+    """
+    Greedily take the best-scoring sections that fit in `budget` (as
+    counted by `measure`) and return them in document order
+    """
+    chosen = []
+    remaining = budget
+    for i in np.argsort(-scores, kind="stable"):
+        cost = measure(sections[i])
+        if cost <= remaining:
+            chosen.append(i)
+            remaining -= cost
+
+    return "".join(sections[i] for i in sorted(chosen))
+
+
+def select_relevant_text(text: str, query: str, budget: int, measure=len) -> str:
+    """
+    Return the parts of `text` most relevant to `query` and the standard
+    financial metrics, packed into `budget`
+    """
+    if measure(text) <= budget:
+        return text
+
+    sections = split_sections(text)
+    scores = score_sections(sections, query_terms(query))
+    packed = pack_sections(sections, scores, budget, measure)
+
+    # A single oversized section can leave nothing packed; fall back to
+    # the plain head of the document rather than sending no text at all
+    return packed or head_within_budget(text, budget, measure)
+
+
+def head_within_budget(text: str, budget: int, measure=len) -> str:
+    """
+    Longest prefix of `text` that fits in `budget`, found by bisection so
+    `measure` can be a tokenizer
+    """
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if measure(text[:mid]) <= budget:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low]
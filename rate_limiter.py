@@ -0,0 +1,116 @@
+## Token-bucket scheduling of LLM calls, shared across worker processes
+import time
+import asyncio
+import threading
+
+import redis
+from dotenv import load_dotenv
+load_dotenv()
+
+from celery_app import REDIS_URL
+from budget import LLM_MODEL, model_limits
+
+
+# Atomically refill two buckets (requests and tokens) and take from both if
+# both have enough. Returns 0 on success, otherwise milliseconds to wait.
+_ACQUIRE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local want = {1, tonumber(ARGV[2])}
+local capacity = {tonumber(ARGV[3]), tonumber(ARGV[4])}
+local wait = 0
+local levels = {}
+
+for i = 1, 2 do
+    local state = redis.call('HMGET', KEYS[i], 'level', 'ts')
+    local level = tonumber(state[1]) or capacity[i]
+    local ts = tonumber(state[2]) or now
+    local rate = capacity[i] / 60000
+    level = math.min(capacity[i], level + (now - ts) * rate)
+    levels[i] = level
+    if level < want[i] then
+        wait = math.max(wait, math.ceil((want[i] - level) / rate))
+    end
+end
+
+for i = 1, 2 do
+    local level = levels[i]
+    if wait == 0 then
+        level = level - want[i]
+    end
+    redis.call('HSET', KEYS[i], 'level', level, 'ts', now)
+    redis.call('PEXPIRE', KEYS[i], 120000)
+end
+
+return wait
+"""
+
+# Upper bound on one sleep so waiters re-check instead of oversleeping
+MAX_WAIT_SECONDS = 5.0
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute buckets for one model.
+
+    State lives in Redis so every API and Celery process shares the same
+    provider budget: callers queue in `acquire` until their request fits
+    instead of all firing and retrying on 429s. When Redis is unreachable
+    the buckets fall back to this process only.
+    """
+
+    def __init__(self, model: str = LLM_MODEL):
+        limits = model_limits(model)
+        self.rpm = limits["rpm"]
+        self.tpm = limits["tpm"]
+        self.keys = [f"ratelimit:{model}:requests", f"ratelimit:{model}:tokens"]
+        # A sync client: the script is sub-millisecond, and an asyncio client
+        # would be bound to the event loop of whichever job created it
+        self._redis = redis.Redis.from_url(
+            REDIS_URL, socket_timeout=0.5, socket_connect_timeout=0.5
+        )
+        self._script = self._redis.register_script(_ACQUIRE_SCRIPT)
+        self._local_lock = threading.Lock()
+        self._local = {"requests": float(self.rpm), "tokens": float(self.tpm), "ts": time.monotonic()}
+
+    def _take_local(self, tokens: int) -> float:
+        with self._local_lock:
+            now = time.monotonic()
+            elapsed = now - self._local["ts"]
+            self._local["ts"] = now
+            self._local["requests"] = min(self.rpm, self._local["requests"] + elapsed * self.rpm / 60)
+            self._local["tokens"] = min(self.tpm, self._local["tokens"] + elapsed * self.tpm / 60)
+
+            wait = max(
+                (1 - self._local["requests"]) * 60 / self.rpm,
+                (tokens - self._local["tokens"]) * 60 / self.tpm,
+                0.0,
+            )
+            if wait == 0:
+                self._local["requests"] -= 1
+                self._local["tokens"] -= tokens
+            return wait
+
+    def _take(self, tokens: int) -> float:
+        try:
+            wait_ms = self._script(
+                keys=self.keys,
+                args=[int(time.time() * 1000), tokens, self.rpm, self.tpm],
+            )
+            return wait_ms / 1000
+        except redis.RedisError:
+            return self._take_local(tokens)
+
+    async def acquire(self, tokens: int):
+        """
+        Wait until one request of `tokens` tokens fits both buckets
+        """
+        # A request larger than the whole bucket could never be admitted
+        tokens = min(tokens, self.tpm)
+        while True:
+            wait = self._take(tokens)
+            if wait <= 0:
+                return
+            await asyncio.sleep(min(wait, MAX_WAIT_SECONDS))
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,102 @@
+## SQLite-backed cache of crew responses
+import os
+import json
+import hashlib
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from database import session_scope
+from models import CachedResponse
+
+
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "5000"))
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+def make_cache_key(query: str, document_text: str, tasks, model: str, extra: str = "") -> str:
+    """
+    Key on everything that determines the answer: the normalized query,
+    the document content actually sent, the task prompt(s), the model and
+    any `extra` content merged into the result (e.g. extracted metrics)
+    """
+    if not isinstance(tasks, (list, tuple)):
+        tasks = [tasks]
+
+    document_hash = hashlib.sha256(document_text.encode("utf-8")).hexdigest()
+    parts = [normalize_query(query), document_hash]
+    for task in tasks:
+        parts += [task.description, task.expected_output]
+    parts.append(model)
+    if extra:
+        parts.append(extra)
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Stores parsed crew outputs in the `response_cache` table so they
+    survive worker restarts. Entries expire after `ttl_seconds`; past
+    `max_entries` the least recently used rows are deleted.
+    """
+
+    def __init__(self, ttl_seconds: int = RESPONSE_CACHE_TTL_SECONDS,
+                 max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.max_entries = max_entries
+
+    def get(self, key: str):
+        with session_scope() as db:
+            entry = db.get(CachedResponse, key)
+            if entry is None:
+                return None
+
+            now = datetime.utcnow()
+            if entry.created_at + self.ttl < now:
+                db.delete(entry)
+                db.commit()
+                return None
+
+            entry.last_used_at = now
+            result_json = entry.result_json
+            db.commit()
+            return json.loads(result_json)
+
+    def put(self, key: str, model: str, result: dict):
+        with session_scope() as db:
+            now = datetime.utcnow()
+            db.merge(CachedResponse(
+                key=key,
+                model=model,
+                result_json=json.dumps(result),
+                created_at=now,
+                last_used_at=now,
+            ))
+            db.commit()
+            self._evict(db)
+
+    def _evict(self, db):
+        db.query(CachedResponse).filter(
+            CachedResponse.created_at < datetime.utcnow() - self.ttl
+        ).delete(synchronize_session=False)
+
+        overflow = db.query(CachedResponse).count() - self.max_entries
+        if overflow > 0:
+            oldest = (
+                db.query(CachedResponse.key)
+                .order_by(CachedResponse.last_used_at)
+                .limit(overflow)
+                .subquery()
+            )
+            db.query(CachedResponse).filter(
+                CachedResponse.key.in_(oldest.select())
+            ).delete(synchronize_session=False)
+        db.commit()
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,265 @@
+## Priority lanes and per-client fair share for analysis jobs
+import os
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import redis
+from sqlalchemy import func, or_
+from dotenv import load_dotenv
+load_dotenv()
+
+from celery_app import JOB_TIMEOUT_SECONDS, LANE_QUEUES, REDIS_URL
+from dedup import IN_FLIGHT_STATUSES
+from job_metrics import quantile
+from models import AnalysisResult
+
+
+LANES = tuple(LANE_QUEUES)
+
+# Bulk jobs handed to Celery at once. The rest wait in the database and are
+# released one client at a time as slots free up, so a client with 500
+# filings cannot hold every worker while others wait.
+BULK_MAX_IN_FLIGHT = int(os.getenv("BULK_MAX_IN_FLIGHT", "8"))
+
+# A client's interactive jobs past this many in flight go to the bulk lane
+INTERACTIVE_MAX_PER_CLIENT = int(os.getenv("INTERACTIVE_MAX_PER_CLIENT", "4"))
+
+# Wait-time percentiles on /queues cover jobs started in this window
+QUEUE_WINDOW_SECONDS = int(os.getenv("QUEUE_WINDOW_SECONDS", "3600"))
+
+# Claims from the API and every worker are serialized so together they
+# never exceed BULK_MAX_IN_FLIGHT
+CLAIM_LOCK_KEY = "scheduler:bulk_claim"
+CLAIM_LOCK_TIMEOUT_SECONDS = 30
+
+_redis = redis.Redis.from_url(REDIS_URL, socket_timeout=0.5, socket_connect_timeout=0.5)
+
+
+@contextmanager
+def _claim_lock():
+    """
+    Yields whether the lock was taken. Without Redis nothing can be
+    dispatched anyway, so the caller skips its claim.
+    """
+    lock = _redis.lock(
+        CLAIM_LOCK_KEY, timeout=CLAIM_LOCK_TIMEOUT_SECONDS, blocking_timeout=10
+    )
+    try:
+        acquired = lock.acquire()
+    except redis.RedisError:
+        acquired = False
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            try:
+                lock.release()
+            except redis.RedisError:
+                # Expired or unreachable; the timeout frees it either way
+                pass
+
+
+def _leaders(db):
+    # Attached duplicates never run themselves
+    return db.query(AnalysisResult).filter(AnalysisResult.duplicate_of.is_(None))
+
+
+def _in_flight(query):
+    return query.filter(
+        AnalysisResult.enqueued_at.isnot(None),
+        AnalysisResult.status.in_(IN_FLIGHT_STATUSES),
+    )
+
+
+def choose_lane(db, client_id: str) -> str:
+    """
+    "interactive", unless the client already has INTERACTIVE_MAX_PER_CLIENT
+    interactive jobs in flight
+    """
+    running = _in_flight(_leaders(db)).filter(
+        AnalysisResult.lane == "interactive",
+        AnalysisResult.client_id == client_id,
+    ).count()
+    return "interactive" if running < INTERACTIVE_MAX_PER_CLIENT else "bulk"
+
+
+def release_lost_jobs(db) -> int:
+    """
+    Put bulk jobs that were handed to Celery and then lost back in the
+    waiting list, so they stop holding a slot. Extraction is not
+    redelivered when its worker dies, so a job still unextracted after
+    JOB_TIMEOUT_SECONDS is lost; the LLM stage is redelivered by the
+    broker, so a job is only given up on after twice that.
+    """
+    now = datetime.utcnow()
+    timeout = timedelta(seconds=JOB_TIMEOUT_SECONDS)
+    released = _in_flight(_leaders(db)).filter(
+        AnalysisResult.lane == "bulk",
+        or_(
+            (AnalysisResult.extracted_at.is_(None)) & (AnalysisResult.enqueued_at < now - timeout),
+            AnalysisResult.enqueued_at < now - 2 * timeout,
+        ),
+    ).update({
+        "status": "PENDING",
+        "enqueued_at": None,
+        "started_at": None,
+        "extracted_at": None,
+    }, synchronize_session=False)
+    db.commit()
+    return released
+
+
+def unclaim(db, job_ids: list):
+    """
+    Return claimed jobs to the waiting list, e.g. when dispatching failed
+    """
+    if not job_ids:
+        return
+    db.query(AnalysisResult).filter(
+        AnalysisResult.id.in_(job_ids), AnalysisResult.status == "PENDING"
+    ).update({"enqueued_at": None}, synchronize_session=False)
+    db.commit()
+
+
+def promote(db, job_id: int) -> bool:
+    """
+    Move a bulk job still waiting for a slot to the interactive lane, for
+    an interactive request that would otherwise wait on it. Returns
+    whether it was promoted; the caller dispatches it.
+    """
+    promoted = db.query(AnalysisResult).filter(
+        AnalysisResult.id == job_id,
+        AnalysisResult.lane == "bulk",
+        AnalysisResult.enqueued_at.is_(None),
+        AnalysisResult.status == "PENDING",
+    ).update({"lane": "interactive", "enqueued_at": datetime.utcnow()}, synchronize_session=False)
+    db.commit()
+    return promoted == 1
+
+
+def claim_bulk_jobs(db) -> list:
+    """
+    Pick waiting bulk jobs to fill the free bulk slots, each time from the
+    client with the fewest jobs in flight (oldest job first on a tie), and
+    mark them enqueued. Returns the claimed records; the caller dispatches
+    them and hands back any it could not (see unclaim).
+    """
+    with _claim_lock() as locked:
+        if not locked:
+            return []
+        release_lost_jobs(db)
+        return _claim(db)
+
+
+def _claim(db) -> list:
+    bulk = _leaders(db).filter(AnalysisResult.lane == "bulk")
+    active = dict(
+        _in_flight(bulk)
+        .with_entities(AnalysisResult.client_id, func.count())
+        .group_by(AnalysisResult.client_id)
+        .all()
+    )
+    free = BULK_MAX_IN_FLIGHT - sum(active.values())
+    if free <= 0:
+        return []
+
+    waiting = {}
+    for job_id, client_id in (
+        bulk.filter(AnalysisResult.enqueued_at.is_(None), AnalysisResult.status == "PENDING")
+        .with_entities(AnalysisResult.id, AnalysisResult.client_id)
+        .order_by(AnalysisResult.id)
+    ):
+        waiting.setdefault(client_id, []).append(job_id)
+
+    chosen = []
+    while free and waiting:
+        client_id = min(waiting, key=lambda c: (active.get(c, 0), waiting[c][0]))
+        chosen.append(waiting[client_id].pop(0))
+        if not waiting[client_id]:
+            del waiting[client_id]
+        active[client_id] = active.get(client_id, 0) + 1
+        free -= 1
+
+    claimed = []
+    for job_id in chosen:
+        updated = db.query(AnalysisResult).filter(
+            AnalysisResult.id == job_id,
+            AnalysisResult.enqueued_at.is_(None),
+        ).update({"enqueued_at": datetime.utcnow()}, synchronize_session=False)
+        db.commit()
+        if updated:
+            claimed.append(db.get(AnalysisResult, job_id))
+    return claimed
+
+
+def _broker_depth(queue: str):
+    # Messages waiting in the Redis list; None when Redis is unreachable
+    try:
+        return _redis.llen(queue)
+    except redis.RedisError:
+        return None
+
+
+def _seconds_summary(values: list) -> dict:
+    values = sorted(values)
+    if not values:
+        return {"count": 0, "p50": None, "p95": None}
+    return {
+        "count": len(values),
+        "p50": round(quantile(values, 0.5), 3),
+        "p95": round(quantile(values, 0.95), 3),
+    }
+
+
+def queue_stats(db) -> dict:
+    """
+    Per lane: broker queue depths, jobs waiting for a bulk slot, queued and
+    running; the oldest current wait; and wait percentiles (submission to
+    extraction start) of recently started jobs. Bulk jobs are also broken
+    down by client.
+    """
+    now = datetime.utcnow()
+    since = now - timedelta(seconds=QUEUE_WINDOW_SECONDS)
+    lanes = {}
+
+    for lane, (extraction_queue, llm_queue) in LANE_QUEUES.items():
+        jobs = _leaders(db).filter(AnalysisResult.lane == lane)
+        pending = jobs.filter(AnalysisResult.status == "PENDING")
+        oldest = pending.with_entities(func.min(AnalysisResult.created_at)).scalar()
+        started = jobs.filter(AnalysisResult.started_at >= since).with_entities(
+            AnalysisResult.created_at, AnalysisResult.started_at
+        )
+
+        lanes[lane] = {
+            "broker_depth": {
+                extraction_queue: _broker_depth(extraction_queue),
+                llm_queue: _broker_depth(llm_queue),
+            },
+            "waiting_for_slot": pending.filter(AnalysisResult.enqueued_at.is_(None)).count(),
+            "queued": pending.filter(AnalysisResult.enqueued_at.isnot(None)).count(),
+            "processing": jobs.filter(AnalysisResult.status == "PROCESSING").count(),
+            "oldest_wait_seconds": round((now - oldest).total_seconds(), 3) if oldest else None,
+            "wait_seconds": _seconds_summary([
+                (started_at - created_at).total_seconds()
+                for created_at, started_at in started if created_at is not None
+            ]),
+        }
+
+    clients = {}
+    bulk = _leaders(db).filter(
+        AnalysisResult.lane == "bulk", AnalysisResult.status.in_(IN_FLIGHT_STATUSES)
+    )
+    for client_id, enqueued, count in (
+        bulk.with_entities(
+            AnalysisResult.client_id, AnalysisResult.enqueued_at.isnot(None), func.count()
+        ).group_by(AnalysisResult.client_id, AnalysisResult.enqueued_at.isnot(None))
+    ):
+        entry = clients.setdefault(client_id, {"waiting_for_slot": 0, "in_flight": 0})
+        entry["in_flight" if enqueued else "waiting_for_slot"] += count
+
+    return {
+        "lanes": lanes,
+        "bulk_clients": clients,
+        "bulk_max_in_flight": BULK_MAX_IN_FLIGHT,
+        "window_seconds": QUEUE_WINDOW_SECONDS,
+    }
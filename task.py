@@ -1,7 +1,7 @@
 ## Importing libraries and files
 from crewai import Task
 
-from agents import financial_analyst, verifier,risk_assessor
+from agents import financial_analyst, verifier, risk_assessor, investment_advisor
 from tools import  FinancialDocumentTool
 
 ## Creating a task to help solve user's query
@@ -57,6 +57,121 @@ analyze_financial_document = Task(
     tools=[],
 )
 
+## Narrative-only analysis for documents whose figures were extracted
+## deterministically (see metrics_extractor.py)
+analyze_financial_narrative = Task(
+    description=(
+        "These key financial metrics were extracted from the document's "
+        "financial statements:\n\n"
+        "{extracted_metrics}\n\n"
+        "Ratios and a rule-based risk assessment computed from the "
+        "extracted figures (ratios are fractions, not percentages):\n\n"
+        "{financial_ratios}\n\n"
+        "Financial document text:\n\n"
+        "{document_text}\n\n"
+        "Answer the user's query: {query}. "
+        "Treat the extracted metrics and ratios as correct and use the document "
+        "text for context on revenue trends, net income trends, debt levels, and "
+        "cash flow indicators. Start from the rule-based risk level and "
+        "confidence score; if you depart from them, say why in risk_explanation."
+    ),
+    expected_output=(
+        "Return output strictly in valid JSON format with the following structure:\n"
+        "{\n"
+        '  "executive_summary": string,\n'
+        '  "risk_level": "Low" | "Medium" | "High",\n'
+        '  "risk_explanation": string,\n'
+        '  "investment_recommendation": "Strong Buy" | "Buy" | "Hold" | "Sell",\n'
+        '  "confidence_score": integer\n'
+        "}\n\n"
+        "Rules:\n"
+        "- Do not restate or recompute the extracted metrics.\n"
+        "- Do NOT use comments.\n"
+        "- Output must be valid JSON only.\n"
+    ),
+    agent=financial_analyst,
+    tools=[],
+)
+
+## Map-reduce tasks for long filings
+# Built per call: chunks run concurrently and a Task/Agent instance keeps
+# per-run state, so each worker thread gets its own copies.
+def make_chunk_metrics_task():
+    return Task(
+        description=(
+            "The following text is one part of a longer financial document:\n\n"
+            "{document_text}\n\n"
+            "Extract every key financial metric stated in this part that is "
+            "relevant to the user's query: {query}. "
+            "Focus on revenue, net income, debt levels and cash flow."
+        ),
+        expected_output=(
+            "Return output strictly in valid JSON format with the following structure:\n"
+            "{\n"
+            '  "key_financial_metrics": [\n'
+            "       {\n"
+            '         "metric": string,\n'
+            '         "value": string | null,\n'
+            '         "trend": string | null\n'
+            "       }\n"
+            "  ],\n"
+            '  "notes": string\n'
+            "}\n\n"
+            "Rules:\n"
+            "- Only include metrics explicitly stated in this part.\n"
+            "- Use an empty list if there are none.\n"
+            "- Output must be valid JSON only.\n"
+        ),
+        agent=financial_analyst.copy(),
+        tools=[],
+    )
+
+
+def make_reduce_analysis_task():
+    return Task(
+        description=(
+            "A long financial document was analyzed in parts. "
+            "These are the key financial metrics found across all parts:\n\n"
+            "{partial_metrics}\n\n"
+            "Notes from each part:\n\n"
+            "{chunk_notes}\n\n"
+            "Ratios and a rule-based risk assessment computed from the "
+            "extracted figures (ratios are fractions, not percentages):\n\n"
+            "{financial_ratios}\n\n"
+            "Combine them to answer the user's query: {query}. "
+            "Summarize revenue trends, net income trends, "
+            "debt levels, and cash flow indicators."
+        ),
+        expected_output=analyze_financial_document.expected_output,
+        agent=financial_analyst.copy(),
+        tools=[],
+    )
+
+
+## Re-prompt for the fields of an answer that failed validation
+# (see pipeline.parse_output). Built per call with the failing task's agent.
+def make_repair_task(agent):
+    return Task(
+        description=(
+            "You answered the user's query: {query}\n\n"
+            "Your answer was:\n\n"
+            "{previous_output}\n\n"
+            "These fields were missing or invalid:\n\n"
+            "{field_errors}\n\n"
+            "Provide corrected values for these fields only, based on your answer."
+        ),
+        expected_output=(
+            "Return output strictly in valid JSON format with the following structure:\n"
+            "{field_schema}\n\n"
+            "Rules:\n"
+            "- Include only the fields listed.\n"
+            "- Do NOT use comments.\n"
+            "- Output must be valid JSON only.\n"
+        ),
+        agent=agent.copy(),
+        tools=[],
+    )
+
 ## Creating an investment analysis task
 # investment_analysis = Task(
 #     description="Look at some financial data and tell them what to buy or sell.\n\
@@ -79,35 +194,42 @@ analyze_financial_document = Task(
 # )
 investment_analysis = Task(
     description=(
+        "Ratios and a rule-based risk assessment computed from the "
+        "extracted figures (ratios are fractions, not percentages):\n\n"
+        "{financial_ratios}\n\n"
+        "Financial document text:\n\n"
+        "{document_text}\n\n"
         "Using the extracted financial document data, analyze the company’s "
         "financial performance and answer the user's query: {query}. "
         "Base your analysis strictly on the document content. "
         "Do not fabricate financial metrics or assumptions. "
         "Identify trends in revenue, profitability, debt, and cash flow. "
+        "Use the computed ratios where available instead of recomputing them. "
         "Explain how these indicators influence investment decisions."
     ),
 
     expected_output=(
-        "Return output strictly in JSON format with the following structure:\n"
+        "Return output strictly in valid JSON format with the following structure:\n"
         "{\n"
-        "  'investment_thesis': string,\n"
-        "  'financial_strengths': list,\n"
-        "  'financial_weaknesses': list,\n"
-        "  'valuation_observation': string,\n"
-        "  'investment_recommendation': 'Strong Buy' | 'Buy' | 'Hold' | 'Sell' | 'Strong Sell',\n"
-        "  'rationale': string,\n"
-        "  'confidence_score': integer (0-100)\n"
+        '  "investment_thesis": string,\n'
+        '  "financial_strengths": list,\n'
+        '  "financial_weaknesses": list,\n'
+        '  "valuation_observation": string,\n'
+        '  "investment_recommendation": "Strong Buy" | "Buy" | "Hold" | "Sell" | "Strong Sell",\n'
+        '  "rationale": string,\n'
+        '  "confidence_score": integer 0-100\n'
         "}\n\n"
         "Rules:\n"
         "- Do not hallucinate data.\n"
         "- Do not include external URLs.\n"
         "- Do not recommend speculative assets unrelated to the document.\n"
         "- Clearly justify recommendation using financial evidence.\n"
-        "- If data is insufficient, state uncertainty explicitly."
+        "- If data is insufficient, state uncertainty explicitly.\n"
+        "- Output must be valid JSON only.\n"
     ),
 
-    agent=financial_analyst,
-    tools=[FinancialDocumentTool()],
+    agent=investment_advisor,
+    tools=[],
     async_execution=False,
 )
 
@@ -134,32 +256,40 @@ investment_analysis = Task(
 
 risk_assessment = Task(
     description=(
+        "Ratios and a rule-based risk assessment computed from the "
+        "extracted figures (ratios are fractions, not percentages):\n\n"
+        "{financial_ratios}\n\n"
+        "Financial document text:\n\n"
+        "{document_text}\n\n"
         "Evaluate the financial risks present in the uploaded financial document. "
         "Base your assessment strictly on quantitative and qualitative data mentioned. "
         "Consider factors such as revenue volatility, debt levels, liquidity, "
         "operational risks, and macroeconomic exposure. "
+        "Start from the rule-based risk level and factors; if you depart from "
+        "them, say why in overall_risk_summary. "
         "Respond directly to the user query: {query}."
     ),
 
     expected_output=(
-        "Return output strictly in JSON format with the following structure:\n"
+        "Return output strictly in valid JSON format with the following structure:\n"
         "{\n"
-        "  'risk_level': 'Low' | 'Medium' | 'High',\n"
-        "  'key_risk_factors': list,\n"
-        "  'downside_scenarios': list,\n"
-        "  'risk_mitigation_strategies': list,\n"
-        "  'overall_risk_summary': string\n"
+        '  "risk_level": "Low" | "Medium" | "High",\n'
+        '  "key_risk_factors": list,\n'
+        '  "downside_scenarios": list,\n'
+        '  "risk_mitigation_strategies": list,\n'
+        '  "overall_risk_summary": string\n'
         "}\n\n"
         "Rules:\n"
         "- Do not exaggerate risk.\n"
         "- Do not fabricate market crises.\n"
         "- Avoid dramatic language.\n"
         "- Base classification on document evidence.\n"
-        "- If insufficient data, explicitly state limitations."
+        "- If insufficient data, explicitly state limitations.\n"
+        "- Output must be valid JSON only.\n"
     ),
 
     agent=risk_assessor,
-    tools=[FinancialDocumentTool()],
+    tools=[],
     async_execution=False,
 )
 
@@ -179,6 +309,8 @@ risk_assessment = Task(
 # )
 verification = Task(
     description=(
+        "Document text:\n\n"
+        "{document_text}\n\n"
         "Analyze the uploaded document and determine whether it is a valid "
         "financial document such as an earnings report, annual report, "
         "financial statement, or investor presentation. "
@@ -186,21 +318,22 @@ verification = Task(
     ),
 
     expected_output=(
-        "Return output strictly in JSON format:\n"
+        "Return output strictly in valid JSON format:\n"
         "{\n"
-        "  'is_financial_document': true | false,\n"
-        "  'document_type': string,\n"
-        "  'confidence_score': integer (0-100),\n"
-        "  'reasoning': string\n"
+        '  "is_financial_document": true | false,\n'
+        '  "document_type": string,\n'
+        '  "confidence_score": integer 0-100,\n'
+        '  "reasoning": string\n'
         "}\n\n"
         "Rules:\n"
         "- Do not assume the document is financial without evidence.\n"
         "- If non-financial, clearly state why.\n"
         "- Do not hallucinate financial terminology.\n"
-        "- Base conclusion only on document text."
+        "- Base conclusion only on document text.\n"
+        "- Output must be valid JSON only.\n"
     ),
 
     agent=verifier,
-    tools=[FinancialDocumentTool()],
+    tools=[],
     async_execution=False
 )
\ No newline at end of file
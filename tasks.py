@@ -1,47 +1,267 @@
+import os
 import json
-from celery_app import celery
-from tools import FinancialDocumentTool
-from crewai import Crew, Process
-from agents import financial_analyst
-from task import analyze_financial_document
-from database import SessionLocal
+import time
+from datetime import datetime
+from celery import chain
+from celery.signals import worker_init, worker_process_init
+from celery_app import LANE_QUEUES, celery
+from database import engine, init_db, session_scope
 from models import AnalysisResult
+from events import publish_event
+from document_index import document_index
+from checkpoints import JobCheckpoints
+from scheduler import claim_bulk_jobs, unclaim
+from upload_store import upload_path
+
+# The crew/LLM stack (pipeline, tools, agents) is imported inside the task
+# bodies so the API can import this module to dispatch jobs without it;
+# workers load it up front in warm_up()
+
+init_db()
+
+# Transient failures of the LLM stage (provider errors, rate limits,
+# timeouts) retry the task with exponential backoff and jitter; stages the
+# failed attempt completed are read back from the job's checkpoints
+TASK_MAX_RETRIES = int(os.getenv("TASK_MAX_RETRIES", "4"))
+TASK_RETRY_BACKOFF_SECONDS = int(os.getenv("TASK_RETRY_BACKOFF_SECONDS", "15"))
+TASK_RETRY_BACKOFF_MAX_SECONDS = int(os.getenv("TASK_RETRY_BACKOFF_MAX_SECONDS", "600"))
+
+
+class TransientJobError(Exception):
+    """
+    A job stage failed in a way a later attempt may not
+    """
+
+
+def warm_up():
+    """
+    Import the crew stack and build the reusable crews, so the first job a
+    worker process takes doesn't pay for it
+    """
+    from pipeline import WARM_TASKS, crew_pool
+    crew_pool.warm(WARM_TASKS)
+
+
+@worker_init.connect
+def _warm_worker(**kwargs):
+    # Runs in the main worker process: solo and threads pools execute
+    # tasks here, and prefork children inherit the loaded modules
+    warm_up()
+
+
+@worker_process_init.connect
+def _warm_worker_process(**kwargs):
+    # Prefork children must not share the parent's database connections
+    engine.dispose(close=False)
+    warm_up()
+
+
+def update_job(job_id, **fields):
+    # Short-lived session per write so no connection is held during the
+    # LLM call
+    with session_scope() as db:
+        db.query(AnalysisResult).filter(AnalysisResult.id == job_id).update(fields)
+        db.commit()
+
+    if "status" in fields:
+        publish_event(job_id, fields["status"])
+
+
+def job_finished(job_id):
+    """
+    A job reached COMPLETED or FAILED: release its bulk slot to the next
+    waiting job
+    """
+    schedule_bulk()
+
 
 @celery.task
-def process_analysis(job_id, query, file_path):
+def extract_document(job_id, query, file_path, mode="single", content_hash=None):
+    """
+    CPU stage, on the extraction queue: parse the PDF and prepare what the
+    LLM stage sends. Returns None when the job failed here.
+    """
+    from pipeline import prepare_document
+    from tools import FinancialDocumentTool
 
-    db = SessionLocal()
+    update_job(job_id, status="PROCESSING", started_at=datetime.utcnow())
+    publish_event(job_id, "PROCESSING", "extracting")
 
+    stats = {}
+    start = time.perf_counter()
     try:
-        tool = FinancialDocumentTool()
-        document_text = tool._run(file_path)
+        if mode == "map_reduce":
+            # The LLM stage reads the whole document back from the
+            # extraction cache
+            FinancialDocumentTool()._run(file_path, content_hash, stats)
+            prepared = {}
+        else:
+            document_text, metrics, analytics = prepare_document(
+                file_path, query, content_hash, stats
+            )
+            prepared = {"document_text": document_text, "metrics": metrics, "analytics": analytics}
+
+    except Exception:
+        update_job(job_id, status="FAILED", finished_at=datetime.utcnow())
+        job_finished(job_id)
+        return None
 
-        MAX_CHARS = 8000
-        document_text = document_text[:MAX_CHARS]
+    update_job(
+        job_id,
+        extracted_at=datetime.utcnow(),
+        extraction_seconds=time.perf_counter() - start,
+        pages=stats.get("pages", 0),
+        characters=stats.get("characters", 0),
+        extraction_cache_hit=bool(stats.get("extraction_cache_hits")),
+    )
+    return prepared
 
-        crew = Crew(
-            agents=[financial_analyst],
-            tasks=[analyze_financial_document],
-            process=Process.sequential,
+
+@celery.task(
+    bind=True,
+    autoretry_for=(TransientJobError,),
+    max_retries=TASK_MAX_RETRIES,
+    retry_backoff=TASK_RETRY_BACKOFF_SECONDS,
+    retry_backoff_max=TASK_RETRY_BACKOFF_MAX_SECONDS,
+    retry_jitter=True,
+    # A job whose worker died is redelivered and resumes from its
+    # checkpoints instead of being lost
+    acks_late=True,
+    reject_on_worker_lost=True,
+)
+def process_analysis(self, prepared, job_id, query, file_path, mode="single", content_hash=None):
+    """
+    I/O stage, on the LLM queue: run the crew(s) on the prepared document.
+    Each crew stage is checkpointed, so a retry only runs what is left.
+    """
+    from pipeline import (
+        Progress,
+        is_transient_error,
+        run_analysis,
+        run_full_analysis,
+        run_map_reduce_analysis,
+    )
+
+    if prepared is None:
+        return
+
+    checkpoints = JobCheckpoints(job_id)
+    if self.request.retries:
+        update_job(job_id, task_retries=self.request.retries)
+        publish_event(job_id, "PROCESSING", f"retry {self.request.retries}/{self.max_retries}")
+
+    progress = Progress(lambda stage: publish_event(job_id, "PROCESSING", stage), checkpoints)
+    llm_started_at = datetime.utcnow()
+    start = time.perf_counter()
+
+    def llm_fields():
+        return {
+            "llm_started_at": llm_started_at,
+            "llm_seconds": time.perf_counter() - start,
+            "finished_at": datetime.utcnow(),
+            "prompt_tokens": progress.stats.get("prompt_tokens", 0),
+            "completion_tokens": progress.stats.get("completion_tokens", 0),
+            "llm_calls": progress.calls,
+            "llm_retries": progress.stats.get("llm_retries", 0),
+            "output_repairs": progress.stats.get("output_repairs", 0),
+        }
+
+    try:
+        if mode == "map_reduce":
+            parsed, from_cache = run_map_reduce_analysis(query, file_path, content_hash, progress)
+        elif mode == "full":
+            parsed, from_cache = run_full_analysis(
+                query, prepared["document_text"], progress,
+                prepared["metrics"], prepared["analytics"],
+            )
+        else:
+            parsed, from_cache = run_analysis(
+                query, prepared["document_text"], progress,
+                prepared["metrics"], prepared["analytics"],
+            )
+
+        fields = llm_fields()
+        persist_start = time.perf_counter()
+        update_job(
+            job_id,
+            result_json=json.dumps(parsed),
+            from_cache=from_cache,
+            status="COMPLETED",
+            **fields,
         )
+        # The result write can only be timed after it committed
+        update_job(job_id, persist_seconds=time.perf_counter() - persist_start)
 
-        result = crew.kickoff({
-            "query": query,
-            "document_text": document_text
-        })
+    except Exception as error:
+        if is_transient_error(error) and self.request.retries < self.max_retries:
+            raise TransientJobError(f"{type(error).__name__}: {error}") from error
+        update_job(job_id, status="FAILED", **llm_fields())
+        checkpoints.clear()
+        job_finished(job_id)
+        return
 
-        parsed = json.loads(result.raw)
+    checkpoints.clear()
+    job_finished(job_id)
 
-        record = db.query(AnalysisResult).filter(AnalysisResult.id == job_id).first()
-        record.result_json = json.dumps(parsed)
-        record.status = "COMPLETED"
+    # Off the job's critical path: the result is already stored
+    if content_hash and not document_index.is_indexed(content_hash):
+        index_document.delay(job_id, file_path, content_hash)
 
-        db.commit()
 
-    except Exception as e:
-        record = db.query(AnalysisResult).filter(AnalysisResult.id == job_id).first()
-        record.status = "FAILED"
-        db.commit()
+def analysis_pipeline(job_id, query, file_path, mode="single", content_hash=None,
+                      lane="interactive"):
+    """
+    Extraction chained into the LLM stage; each runs on its own queue of
+    the job's lane
+    """
+    extraction_queue, llm_queue = LANE_QUEUES[lane]
+    return chain(
+        extract_document.si(job_id, query, file_path, mode, content_hash).set(queue=extraction_queue),
+        process_analysis.s(job_id, query, file_path, mode, content_hash).set(queue=llm_queue),
+    )
+
+
+def dispatch_analysis(job_id, query, file_path, mode="single", content_hash=None,
+                      lane="interactive"):
+    analysis_pipeline(job_id, query, file_path, mode, content_hash, lane).delay()
+
+
+def schedule_bulk():
+    """
+    Dispatch waiting bulk jobs into whatever bulk slots are free, fairly
+    across clients (see scheduler.claim_bulk_jobs). Called when bulk jobs
+    are submitted and whenever a job finishes.
+    """
+    with session_scope() as db:
+        jobs = [
+            (record.id, record.query, upload_path(record.file_hash), record.mode or "single",
+             record.file_hash)
+            for record in claim_bulk_jobs(db)
+        ]
+
+    for position, args in enumerate(jobs):
+        try:
+            dispatch_analysis(*args, lane="bulk")
+        except Exception:
+            # Broker unreachable: give the undispatched slots back
+            with session_scope() as db:
+                unclaim(db, [job_id for job_id, *_ in jobs[position:]])
+            raise
+
+
+@celery.task
+def index_document(job_id, file_path, content_hash):
+    """
+    Add a processed document to the search index. The full extraction is
+    cached by map-reduce jobs and by documents that fit in CANDIDATE_CHARS;
+    other documents are extracted again here, on the bulk extraction queue,
+    and the result cached for later jobs.
+    """
+    from tools import FinancialDocumentTool
+
+    with session_scope() as db:
+        record = db.get(AnalysisResult, job_id)
+        file_name = record.file_name if record is not None else None
 
-    finally:
-        db.close()
\ No newline at end of file
+    text = FinancialDocumentTool()._run(file_path, content_hash)
+    document_index.add_document(content_hash, file_name, text)
@@ -0,0 +1,93 @@
+from metrics_extractor import extract_line_items, to_key_financial_metrics
+
+
+INCOME_STATEMENT = """
+Consolidated Statements of Operations
+(In millions, except per share data)
+Q2-2024 Q2-2025
+Total revenues 25,500 22,496
+Gross margin 16.3% 17.2%
+Total gross profit 4,578 3,878
+Income from operations 1,605 923
+Net income attributable to common stockholders 1,478 1,172
+"""
+
+BALANCE_SHEET = """
+(in millions)
+December 31, 2024 June 30, 2025
+Cash and cash equivalents 16,139 15,587
+Total current assets 58,360 64,653
+Total assets 122,070 128,567
+Total liabilities 48,390 50,535
+"""
+
+CASH_FLOW = """
+(In millions)
+Q1-2025 Q2-2025
+Net cash provided by operating activities 2,156 2,540
+Capital expenditures (2,492) (2,394)
+Free cash flow (336) 146
+"""
+
+
+def test_percentage_rows_are_not_currency_items():
+    items = extract_line_items(INCOME_STATEMENT)
+
+    # "Gross margin 16.3%" must not become gross_profit = $16M
+    assert items["gross_profit"]["values"] == {"Q2-2024": 4578e6, "Q2-2025": 3878e6}
+
+
+def test_income_statement_rows_scaled_to_units():
+    items = extract_line_items(INCOME_STATEMENT)
+
+    assert items["revenue"]["unit"] == "millions"
+    assert items["revenue"]["values"] == {"Q2-2024": 25500e6, "Q2-2025": 22496e6}
+    assert items["operating_income"]["values"]["Q2-2025"] == 923e6
+    assert items["net_income"]["values"]["Q2-2025"] == 1172e6
+
+
+def test_dated_balance_sheet_columns():
+    items = extract_line_items(BALANCE_SHEET)
+
+    assert list(items["cash"]["values"]) == ["2024-12-31", "2025-06-30"]
+    assert items["total_assets"]["values"]["2025-06-30"] == 128567e6
+    assert items["total_liabilities"]["values"]["2024-12-31"] == 48390e6
+
+
+def test_parenthesised_negatives():
+    items = extract_line_items(CASH_FLOW)
+
+    assert items["capital_expenditures"]["values"] == {"Q1-2025": -2492e6, "Q2-2025": -2394e6}
+    assert items["free_cash_flow"]["values"] == {"Q1-2025": -336e6, "Q2-2025": 146e6}
+
+
+def test_loss_rows_are_negative():
+    text = "(in millions)\n2025 2024\nNet loss 1,234 2,000\n"
+
+    assert extract_line_items(text)["net_income"]["values"] == {"2024": -2000e6, "2025": -1234e6}
+
+
+def test_per_share_rows_are_not_net_income():
+    text = (
+        "(in millions, except per share data)\n2025 2024\n"
+        "Net income per share 0.52 0.41\n"
+        "Net income per diluted share 0.50 0.40\n"
+        "Net income 1,478 1,172\n"
+    )
+
+    assert extract_line_items(text)["net_income"]["values"] == {"2024": 1172e6, "2025": 1478e6}
+
+
+def test_prose_mentioning_a_label_is_ignored():
+    text = INCOME_STATEMENT + "Revenue decreased 12% due to lower average selling prices in 2025\n"
+
+    assert extract_line_items(text)["revenue"]["values"]["Q2-2025"] == 22496e6
+
+
+def test_key_financial_metrics_shape():
+    metrics = to_key_financial_metrics(extract_line_items(CASH_FLOW))
+    capex = next(m for m in metrics if m["metric"] == "Capital expenditures")
+
+    assert capex["value"] == "-$2.39 billion (Q2-2025)"
+    # Outflows compare by magnitude
+    assert capex["trend"] == "decreased 3.9% from Q1-2025 to Q2-2025"
@@ -0,0 +1,88 @@
+import json
+
+import pytest
+
+from output_parser import (
+    OutputParseError,
+    RiskAssessment,
+    Verification,
+    parse_json_object,
+    repair_json,
+    validate_output,
+)
+
+
+def test_fenced_output():
+    raw = 'Here is the analysis:\n```json\n{"risk_level": "High", "notes": "ok"}\n```\nThanks.'
+
+    assert parse_json_object(raw) == {"risk_level": "High", "notes": "ok"}
+
+
+def test_prose_wrapped_output():
+    raw = 'Sure! {"is_financial_document": true, "document_type": "10-Q"} Let me know.'
+
+    assert parse_json_object(raw) == {"is_financial_document": True, "document_type": "10-Q"}
+
+
+def test_trailing_commas():
+    assert json.loads(repair_json('{"a": [1, 2,], "b": 3,}')) == {"a": [1, 2], "b": 3}
+
+
+def test_single_and_curly_quotes():
+    assert json.loads(repair_json("{'a': 'it\\'s', “b”: “x”}")) == {"a": "it's", "b": "x"}
+
+
+def test_python_literals_and_unquoted_keys():
+    repaired = repair_json("{flag: True, other: False, missing: None}")
+
+    assert json.loads(repaired) == {"flag": True, "other": False, "missing": None}
+
+
+def test_comments_and_raw_newlines():
+    repaired = repair_json('{"a": 1, // one\n /* two */ "b": "line\nbreak"}')
+
+    assert json.loads(repaired) == {"a": 1, "b": "line\nbreak"}
+
+
+def test_numbers_json_rejects():
+    assert json.loads(repair_json('{"a": +5, "b": .5, "c": 7.}')) == {"a": 5, "b": 0.5, "c": 7}
+
+
+def test_truncated_object_is_closed():
+    raw = '{"key_risk_factors": ["debt", "margin'
+
+    assert parse_json_object(raw) == {"key_risk_factors": ["debt", "margin"]}
+    assert json.loads(repair_json('{"a": [1, {"b":')) == {"a": [1, {"b": None}]}
+
+
+def test_no_object_raises():
+    with pytest.raises(OutputParseError):
+        parse_json_object("I could not analyze this document.")
+
+
+def test_scores_normalized_to_percent():
+    base = {"is_financial_document": True, "document_type": "10-Q", "reasoning": "tables"}
+
+    for score, expected in (("0.85", 85), (0.85, 85), ("85%", 85), ("85", 85), (85.4, 85)):
+        validated, errors = validate_output({**base, "confidence_score": score}, Verification)
+        assert errors == {}
+        assert validated["confidence_score"] == expected
+
+
+def test_choices_normalized_and_errors_named():
+    data = {
+        "risk_level": "  high ",
+        "key_risk_factors": "leverage",
+        "downside_scenarios": [],
+        "risk_mitigation_strategies": [],
+        "overall_risk_summary": "Elevated",
+    }
+    validated, errors = validate_output(data, RiskAssessment)
+
+    assert errors == {}
+    assert validated["risk_level"] == "High"
+    assert validated["key_risk_factors"] == ["leverage"]
+
+    validated, errors = validate_output({**data, "risk_level": "extreme"}, RiskAssessment)
+    assert validated is None
+    assert list(errors) == ["risk_level"]
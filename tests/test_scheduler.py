@@ -0,0 +1,81 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import scheduler
+from database import Base
+from models import AnalysisResult
+
+
+@pytest.fixture
+def db(monkeypatch):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    monkeypatch.setattr(scheduler, "BULK_MAX_IN_FLIGHT", 4)
+    yield session
+    session.close()
+
+
+def add_jobs(db, client_id, count, **fields):
+    jobs = [
+        AnalysisResult(query="q", status="PENDING", lane="bulk", client_id=client_id, **fields)
+        for _ in range(count)
+    ]
+    db.add_all(jobs)
+    db.commit()
+    return [job.id for job in jobs]
+
+
+def test_free_slots_alternate_between_clients(db):
+    a = add_jobs(db, "a", 5)
+    b = add_jobs(db, "b", 2)
+
+    claimed = [job.id for job in scheduler._claim(db)]
+
+    # Fewest in flight first, oldest job on a tie
+    assert claimed == [a[0], b[0], a[1], b[1]]
+    assert all(db.get(AnalysisResult, job_id).enqueued_at for job_id in claimed)
+
+
+def test_client_with_jobs_in_flight_waits_its_turn(db):
+    add_jobs(db, "a", 2, enqueued_at=datetime.utcnow())
+    a = add_jobs(db, "a", 3)
+    b = add_jobs(db, "b", 3)
+
+    claimed = [job.id for job in scheduler._claim(db)]
+
+    assert claimed == [b[0], b[1]]
+
+
+def test_no_claims_when_slots_are_full(db):
+    add_jobs(db, "a", 4, enqueued_at=datetime.utcnow())
+    add_jobs(db, "b", 2)
+
+    assert scheduler._claim(db) == []
+
+
+def test_duplicates_and_interactive_jobs_are_not_claimed(db):
+    (leader,) = add_jobs(db, "a", 1)
+    add_jobs(db, "a", 1, duplicate_of=leader)
+    db.add(AnalysisResult(query="q", status="PENDING", lane="interactive", client_id="b"))
+    db.commit()
+
+    assert [job.id for job in scheduler._claim(db)] == [leader]
+
+
+def test_unclaim_and_promote(db):
+    (job_id,) = add_jobs(db, "a", 1)
+    scheduler._claim(db)
+
+    scheduler.unclaim(db, [job_id])
+    db.expire_all()
+    assert db.get(AnalysisResult, job_id).enqueued_at is None
+
+    assert scheduler.promote(db, job_id)
+    # Already dispatched on the interactive lane
+    assert not scheduler.promote(db, job_id)
+    db.expire_all()
+    assert db.get(AnalysisResult, job_id).lane == "interactive"
@@ -0,0 +1,24 @@
+## Whitespace normalization shared by the document tools
+import re
+
+
+# Runs of blank lines and runs of spaces collapse to a single character.
+# Two compiled substitutions with constant replacements are linear in the
+# input size and benchmark faster than a single regex with a callback.
+_NEWLINE_RUNS = re.compile(r"\n{2,}")
+_SPACE_RUNS = re.compile(r" {2,}")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Collapse repeated newlines and repeated spaces in linear time
+    """
+    text = _NEWLINE_RUNS.sub("\n", text)
+    return _SPACE_RUNS.sub(" ", text)
+
+
+def join_pages(pages) -> str:
+    """
+    Join page texts into one report and normalize it in a single pass
+    """
+    return normalize_text("\n".join(pages) + "\n")
@@ -1,5 +1,6 @@
 ## Importing libraries and files
 import os
+import json
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -9,6 +10,12 @@ load_dotenv()
 from langchain_community.document_loaders import PyPDFLoader
 from crewai.tools import BaseTool
 
+from extraction_cache import extraction_cache, file_sha256
+from text_normalize import join_pages, normalize_text
+from parallel_extract import extract_pages_parallel
+from metrics_extractor import extract_line_items
+from analytics import analyze_line_items
+
 ## Creating search tool
 # search_tool = SerperDevTool()
 
@@ -38,42 +45,109 @@ from crewai.tools import BaseTool
 #             full_report += content + "\n"
             
 #         return full_report
+def _count(stats, **amounts):
+    # Optional per-job counters (pages, characters, cache hits)
+    if stats is not None:
+        for name, amount in amounts.items():
+            stats[name] = stats.get(name, 0) + amount
+
+
 class FinancialDocumentTool(BaseTool):
     name: str = "financial_document_reader"
     description: str = "Reads a financial PDF document and returns its text content."
 
-    def _run(self, path: str) -> str:
-        loader = PyPDFLoader(path)
-        docs = loader.load()
-
-        full_report = ""
-        for doc in docs:
-            content = doc.page_content
-            while "\n\n" in content:
-                content = content.replace("\n\n", "\n")
-            full_report += content + "\n"
+    def _run(self, path: str, content_hash: str = None, stats: dict = None) -> str:
+        # Repeat uploads of the same file skip PDF parsing entirely
+        content_hash = content_hash or file_sha256(path)
+        cached = extraction_cache.get(content_hash)
+        if cached is not None:
+            _count(stats, extraction_cache_hits=1, characters=len(cached))
+            return cached
 
+        full_report = self._extract(path, stats)
+        extraction_cache.put(content_hash, full_report)
+        _count(stats, characters=len(full_report))
         return full_report
 
+    def _extract(self, path: str, stats: dict = None) -> str:
+        # PDFs are parsed in page ranges across a process pool; workers
+        # that cannot start processes parse serially
+        pages = extract_pages_parallel(path)
+        if pages is None:
+            pages = list(self.iter_pages(path))
+        _count(stats, pages=len(pages))
+        return join_pages(pages)
+
+    def iter_pages(self, path: str):
+        """
+        Yield normalized page texts one at a time; pages after the caller
+        stops iterating are never parsed
+        """
+        for doc in PyPDFLoader(path).lazy_load():
+            yield normalize_text(doc.page_content)
+
+    def read_with_budget(self, path: str, max_chars: int, content_hash: str = None,
+                         stats: dict = None) -> str:
+        """
+        Return at most `max_chars` characters of the document, parsing only
+        as many pages as needed to fill the budget
+        """
+        content_hash = content_hash or file_sha256(path)
+        # One logical lookup: the head entry is only a fallback
+        cached = extraction_cache.get(content_hash, count_miss=False)
+        if cached is None:
+            budget_key = f"{content_hash}-head{max_chars}"
+            cached = extraction_cache.get(budget_key)
+        if cached is not None:
+            cached = cached[:max_chars]
+            _count(stats, extraction_cache_hits=1, characters=len(cached))
+            return cached
+
+        # The budget is filled from page ranges across the process pool,
+        # or else pages are parsed one at a time until it is full
+        pages = extract_pages_parallel(path, max_chars)
+        if pages is None:
+            pages = []
+            total_chars = 0
+            for page in self.iter_pages(path):
+                pages.append(page)
+                total_chars += len(page) + 1
+                if total_chars >= max_chars:
+                    break
+
+        text = "".join(page + "\n" for page in pages)
+        if len(text) < max_chars:
+            # The whole document fit: store it exactly as _run would, so it
+            # doubles as the full extraction
+            text = join_pages(pages)
+            extraction_cache.put(content_hash, text)
+        else:
+            text = text[:max_chars]
+            extraction_cache.put(budget_key, text)
+        _count(stats, pages=len(pages), characters=len(text))
+        return text
+
 ## Creating Investment Analysis Tool
-class InvestmentTool:
-    async def analyze_investment_tool(financial_document_data):
-        # Process and analyze the financial document data
-        processed_data = financial_document_data
-        
-        # Clean up the data format
-        i = 0
-        while i < len(processed_data):
-            if processed_data[i:i+2] == "  ":  # Remove double spaces
-                processed_data = processed_data[:i] + processed_data[i+1:]
-            else:
-                i += 1
-                
-        # TODO: Implement investment analysis logic here
-        return "Investment analysis functionality to be implemented"
+class InvestmentTool(BaseTool):
+    name: str = "investment_analyzer"
+    description: str = (
+        "Computes growth, margin, leverage, liquidity and cash-conversion "
+        "ratios from the financial statements in a document's text."
+    )
+
+    def _run(self, financial_document_data: str) -> str:
+        items = extract_line_items(normalize_text(financial_document_data))
+        return json.dumps(analyze_line_items(items)["ratios"])
 
 ## Creating Risk Assessment Tool
-class RiskTool:
-    async def create_risk_assessment_tool(financial_document_data):        
-        # TODO: Implement risk assessment logic here
-        return "Risk assessment functionality to be implemented"
\ No newline at end of file
+class RiskTool(BaseTool):
+    name: str = "risk_assessor"
+    description: str = (
+        "Scores liquidity, leverage, profitability and trend risks from the "
+        "financial statements in a document's text."
+    )
+
+    def _run(self, financial_document_data: str) -> str:
+        items = extract_line_items(normalize_text(financial_document_data))
+        assessment = analyze_line_items(items)
+        return json.dumps({k: v for k, v in assessment.items() if k != "ratios"})
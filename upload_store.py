@@ -0,0 +1,13 @@
+## Where uploaded documents are stored on disk
+import os
+
+from dotenv import load_dotenv
+load_dotenv()
+
+
+# Shared by the API, which writes uploads, and the workers, which read them
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "data")
+
+
+def upload_path(content_hash: str) -> str:
+    return os.path.join(UPLOAD_DIR, f"{content_hash}.pdf")
@@ -0,0 +1,84 @@
+## Streaming, content-addressed storage of uploaded documents
+import os
+import uuid
+import hashlib
+
+from fastapi import HTTPException, UploadFile
+from dotenv import load_dotenv
+load_dotenv()
+
+from upload_store import UPLOAD_DIR, upload_path
+
+
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_KB", "256")) * 1024
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "100")) * 1024 * 1024
+# Whole /analyze/batch request; each file still has MAX_UPLOAD_BYTES
+MAX_BATCH_UPLOAD_BYTES = int(os.getenv("MAX_BATCH_UPLOAD_MB", "2048")) * 1024 * 1024
+
+PDF_MAGIC = b"%PDF-"
+
+
+# Room for multipart boundaries and the other form fields
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+UPLOAD_TOO_LARGE = f"Upload exceeds the {MAX_UPLOAD_BYTES // (1024 * 1024)} MB limit"
+BATCH_TOO_LARGE = f"Batch upload exceeds the {MAX_BATCH_UPLOAD_BYTES // (1024 * 1024)} MB limit"
+
+
+def upload_too_large(content_length, limit: int = MAX_UPLOAD_BYTES) -> bool:
+    """
+    Whether a request's declared size is already over `limit`, so it can
+    be rejected before any of the body is read
+    """
+    try:
+        return int(content_length) > limit + MULTIPART_OVERHEAD_BYTES
+    except (TypeError, ValueError):
+        return False
+
+
+async def save_upload(file: UploadFile):
+    """
+    Copy an upload to UPLOAD_DIR in fixed-size chunks, hashing as it goes.
+
+    The file is stored as `<sha256>.pdf`, so identical uploads share one
+    copy on disk. Memory use is one chunk regardless of file size.
+
+    Returns (file_path, content_hash, size_bytes).
+    """
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    tmp_path = os.path.join(UPLOAD_DIR, f".upload-{uuid.uuid4()}.part")
+
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp_path, "wb") as f:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                if size == 0 and not chunk.startswith(PDF_MAGIC):
+                    raise HTTPException(status_code=415, detail="Only PDF documents are supported")
+
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise HTTPException(status_code=413, detail=UPLOAD_TOO_LARGE)
+
+                digest.update(chunk)
+                f.write(chunk)
+
+        if size == 0:
+            raise HTTPException(status_code=400, detail="Uploaded file is empty")
+
+        content_hash = digest.hexdigest()
+        file_path = upload_path(content_hash)
+        if os.path.exists(file_path):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, file_path)
+
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return file_path, content_hash, size